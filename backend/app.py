@@ -1,69 +1,194 @@
+import hashlib
 import json
 import logging
 import os
+import queue
 import secrets
 import sys
+import threading
+import time
+from datetime import datetime, timedelta
 
 sys.path.append("/app/backend")
 
-import requests
 from dotenv import load_dotenv
-from flasgger import Swagger
 from flask import (
+    Blueprint,
     Flask,
+    Response,
+    current_app,
+    g,
     jsonify,
     redirect,
-    render_template,
     request,
-    send_from_directory,
     session,
+    stream_with_context,
     url_for,
 )
 from flask_cors import CORS
-from handler.mongoHandler import insertCompanyUser, insertWorkAttendance
+from handler.lineHandler import acceptEvents, eventQueueStats
+from handler.mongoClient import mongoHealth
+from handler.mongoHandler import ensureIndexes, insertCompanyUser
+from handler.reportHandler import iterAttendanceReport, streamCsv, streamNdjson
 from linebot import LineBotApi, WebhookHandler
 from linebot.exceptions import InvalidSignatureError
-from linebot.models import MessageEvent, StickerSendMessage, TextMessage, TextSendMessage
-from utils.auto_calendar import *
+from utils.schedule_cache import (
+    get_cached_solution,
+    get_or_solve_solution,
+    is_solved,
+    resolve_fingerprint,
+    schedule_fingerprint,
+)
+from utils.schedule_jobs import cancel_job, get_job, submit_job, wait_for_job
+from utils.httpClient import (
+    PooledLineHttpClient,
+    getHttpSession,
+    httpConnectTimeout,
+    httpReadTimeout,
+)
+from utils.metrics import incCounter, observe, renderMetrics, timer
+from utils.requestProfiler import finishProfile, shouldProfile, startProfile
+from utils.staticAssets import buildAssetManifest, sendAsset, sendAssetOrIndex
+from utils.time import getTimezone
 
 # load dot env setting
 load_dotenv()
 
-app = Flask(__name__, static_folder="static", static_url_path="/static")
-swagger = Swagger(app)
-app.secret_key = os.urandom(24)
-
 channelAccessToken = os.getenv("CHANNEL_ACCESS_TOKEN")
 channelSecret = os.getenv("CHANNEL_SECRET")
 lineLoginSecret = os.getenv("LINE_LOGIN_SECRET")
 lineLoginChannelId = os.getenv("LINE_LOGIN_CHANNEL_ID")
 lineLoginCallbackUrl = os.getenv("LINE_LOGIN_CALLBACK_URL")
-lineAuthUrl = os.getenv("LINE_AUTHORIZATION_URL")
-lineTokenUrl = os.getenv("LINE_TOKEN_URL")
-lineProfileUrl = os.getenv("LINE_PROFILE_URL")
+lineAuthUrl = os.getenv("LINE_AUTHORIZATION_URL", "https://access.line.me/oauth2/v2.1/authorize")
+lineTokenUrl = os.getenv("LINE_TOKEN_URL", "https://api.line.me/oauth2/v2.1/token")
+lineProfileUrl = os.getenv("LINE_PROFILE_URL", "https://api.line.me/v2/profile")
+# point these at a local stub server in tests
+lineApiEndpoint = os.getenv("LINE_API_ENDPOINT", "https://api.line.me")
+lineApiDataEndpoint = os.getenv("LINE_API_DATA_ENDPOINT", "https://api-data.line.me")
 serviceUrl = os.getenv("SERVICE_URL")
+autoCalendarDecompose = os.getenv("AUTO_CALENDAR_DECOMPOSE", "true")
+autoCalendarWorkers = int(os.getenv("AUTO_CALENDAR_WORKERS", "0")) or None
+autoCalendarEngine = os.getenv("AUTO_CALENDAR_ENGINE", "auto")
+# React build output, copied here by heroku-postbuild
+staticDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+# flasgger is the single slowest import, production can leave /apidocs out
+enableSwagger = os.getenv("ENABLE_SWAGGER", "true").lower() == "true"
 
-
-CORS(
-    app,
-    supports_credentials=True,
-    origins=["http://localhost:3000", "http://localhost:5000", serviceUrl],
-)
 logging.basicConfig(level=logging.INFO)
 
-lineBotApi = LineBotApi(channelAccessToken)
-handler = WebhookHandler(channelSecret)
+api = Blueprint("api", __name__)
+
+_lineBotApi = None
+_webhookHandler = None
+_workerPid = None
+_workerLock = threading.Lock()
+
+
+def getLineBotApi():
+    # replies share the per-process keep-alive pool with the OAuth calls
+    global _lineBotApi
+    if _lineBotApi is None:
+        _lineBotApi = LineBotApi(
+            channelAccessToken,
+            endpoint=lineApiEndpoint,
+            data_endpoint=lineApiDataEndpoint,
+            timeout=(httpConnectTimeout, httpReadTimeout),
+            http_client=PooledLineHttpClient,
+        )
+    return _lineBotApi
+
+
+def getWebhookHandler():
+    global _webhookHandler
+    if _webhookHandler is None:
+        _webhookHandler = WebhookHandler(channelSecret)
+    return _webhookHandler
+
+
+def autoCalendar():
+    # PuLP and NumPy load on the first scheduling call instead of at worker boot
+    from utils import auto_calendar
+
+    return auto_calendar
+
+
+def scheduleFormat():
+    from utils import schedule_format
+
+    return schedule_format
+
+
+def startWorker():
+    # once per worker, on its first request, i.e. after gunicorn has forked;
+    # in the background so an unreachable cluster does not hold up the request
+    global _workerPid
+    if _workerPid == os.getpid():
+        return
+    with _workerLock:
+        if _workerPid != os.getpid():
+            _workerPid = os.getpid()
+            threading.Thread(target=ensureIndexes, daemon=True).start()
+
+
+def startRequest():
+    g.requestStart = time.perf_counter()
+    g.profiler = startProfile() if shouldProfile(request.headers.get("X-Profile")) else None
+
+
+def finishRequest(response):
+    # the endpoint name, not the path, keeps the label set small
+    if "requestStart" in g:
+        observe(
+            "http_request_seconds",
+            time.perf_counter() - g.requestStart,
+            endpoint=request.endpoint or "unmatched",
+            method=request.method,
+            status=response.status_code,
+        )
+    if g.get("profiler") is not None:
+        path = finishProfile(g.profiler, request.endpoint or "unmatched")
+        response.headers["X-Profile-File"] = os.path.basename(path)
+    return response
+
+
+def createApp():
+    # /static is served from the asset manifest below instead of Flask's static route
+    app = Flask(__name__, static_folder=None)
+    app.secret_key = os.urandom(24)
+    app.extensions["assetManifest"] = buildAssetManifest(staticDir)
+    if enableSwagger:
+        from flasgger import Swagger
+
+        Swagger(app)
+    CORS(
+        app,
+        supports_credentials=True,
+        origins=["http://localhost:3000", "http://localhost:5000", serviceUrl],
+    )
+    app.before_request(startWorker)
+    app.before_request(startRequest)
+    app.after_request(finishRequest)
+    app.register_blueprint(api)
+    return app
 
 
-@app.route("/")
+@api.route("/")
 def index():
-    return render_template("index.html")
+    return sendAssetOrIndex(current_app.extensions["assetManifest"], "index.html")
+
 
+@api.route("/static/<path:filename>")
+def serveStatic(filename):
+    asset = current_app.extensions["assetManifest"].get(filename)
+    if asset is None:
+        return jsonify({"message": "Not found."}), 404
+    return sendAsset(asset)
 
-@app.route("/auth/line", methods=["GET"])
+
+@api.route("/auth/line", methods=["GET"])
 def auth_line():
     oauth_url = (
-        "https://access.line.me/oauth2/v2.1/authorize?"
+        f"{lineAuthUrl}?"
         f"response_type=code&client_id={lineLoginChannelId}"
         f"&redirect_uri={lineLoginCallbackUrl}"
         "&state=12345abcde&scope=profile%20openid"
@@ -71,7 +196,7 @@ def auth_line():
     return redirect(oauth_url)
 
 
-@app.route("/auth/line/callback", methods=["POST"])
+@api.route("/auth/line/callback", methods=["POST"])
 def auth_line_callback():
     code = request.args.get("code")
     state = request.args.get("state")
@@ -80,7 +205,7 @@ def auth_line_callback():
     if not code:
         return "Authorization failed.", 400
 
-    token_url = "https://api.line.me/oauth2/v2.1/token"
+    token_url = lineTokenUrl
     data = {
         "grant_type": "authorization_code",
         "code": code,
@@ -89,7 +214,7 @@ def auth_line_callback():
         "client_secret": lineLoginSecret,
     }
     headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    token_response = requests.post(token_url, data=data, headers=headers)
+    token_response = getHttpSession().post(token_url, data=data, headers=headers)
     token_json = token_response.json()
 
     access_token = token_json.get("access_token")
@@ -97,7 +222,7 @@ def auth_line_callback():
         return "Failed to obtain access token.", 400
 
     headers = {"Authorization": f"Bearer {access_token}"}
-    profile_response = requests.get(lineProfileUrl, headers=headers)
+    profile_response = getHttpSession().get(lineProfileUrl, headers=headers)
     profile_json = profile_response.json()
 
     user_id = profile_json.get("userId")
@@ -115,7 +240,7 @@ def auth_line_callback():
     return redirect(serviceUrl)
 
 
-@app.route("/api/user", methods=["GET"])
+@api.route("/api/user", methods=["GET"])
 def get_user():
     user = session.get("user")
     logging.debug(f"get_user called. Authenticated: {bool(user)}")
@@ -125,138 +250,433 @@ def get_user():
     return jsonify({"authenticated": True, "user": user})
 
 
-@app.route("/api/logout", methods=["POST"])
+@api.route("/api/logout", methods=["POST"])
 def logout():
     session.pop("user", None)
     return jsonify({"message": "Logged out successfully."})
 
 
-@app.route("/callback", methods=["POST"])
+@api.route("/callback", methods=["POST"])
 def linebot():
     body = request.get_data(as_text=True)
     print("Request: " + body)
     try:
-        jsonData = json.loads(body)
+        # validate once and parse once; in queue mode the events are handled after we ack
         signature = request.headers["X-Line-Signature"]
-        handler.handle(body, signature)
-        tk = jsonData["events"][0]["replyToken"]
-        type = jsonData["events"][0]["message"]["type"]
-        if type == "text":
-            msg = jsonData["events"][0]["message"]["text"]
-            if msg[:7] == "建立個人檔案:":
-                fileMsg = msg[7:]
-                reply = insertCompanyUser(jsonData, fileMsg)
-            elif msg == "打卡":
-                reply = insertWorkAttendance(jsonData)
-            elif msg == "使用說明" or msg == "如何使用":
-                emoji = [{"index": 10, "productId": "5ac1bfd5040ab15980c9b435", "emojiId": "009"}]
-                message = "歡迎使用假勤寶寶系統$\n假勤寶寶主要是管理您上下班時間以及請假相關的事宜\n\n注意：在使用之前，請先建檔，建檔訊息格式為： 建立個人檔案:[公司名稱] [姓名] [工號] [生日] (ex. 建立個人檔案:開心公司 假勤寶寶 123456 1998/01/01)"
-                reply = [
-                    TextSendMessage(message, emojis=emoji),
-                    StickerSendMessage(sticker_id="11825378", package_id="6632"),
-                ]
-            else:
-                emoji = [{"index": 14, "productId": "5ac1bfd5040ab15980c9b435", "emojiId": "005"}]
-                message = "指令超出本寶寶的理解範圍了啦$ 等本寶寶學習一下!"
-                reply = [
-                    TextSendMessage(message, emojis=emoji),
-                    StickerSendMessage(sticker_id="52002750", package_id="11537"),
-                ]
-        else:
-            emoji = [{"index": 12, "productId": "5ac1bfd5040ab15980c9b435", "emojiId": "005"}]
-            message = "超出本寶寶的理解範圍了啦$ 等本寶寶學習一下!"
-            reply = [
-                TextSendMessage(message, emojis=emoji),
-                StickerSendMessage(sticker_id="52002750", package_id="11537"),
-            ]
-
-        if isinstance(reply, list):
-            lineBotApi.reply_message(tk, reply)
-        else:
-            lineBotApi.reply_message(tk, TextSendMessage(reply))
+        with timer("line_webhook_seconds", phase="signature"):
+            valid = getWebhookHandler().parser.signature_validator.validate(body, signature)
+        if not valid:
+            raise InvalidSignatureError("Invalid signature. signature=" + signature)
+        with timer("line_webhook_seconds", phase="parse"):
+            jsonData = json.loads(body)
+        # in queue mode this is only the enqueue, the Mongo and reply time is in line_event_seconds
+        with timer("line_webhook_seconds", phase="dispatch"):
+            acceptEvents(getLineBotApi(), jsonData.get("events", []))
     except Exception as e:
+        incCounter("line_webhook_failures_total", reason=type(e).__name__)
         print("Process message fail. Reason: " + str(e))
     return "OK"
 
 
-@app.route("/test", methods=["POST"])
+@api.route("/metrics", methods=["GET"])
+def metrics():
+    # summed over every worker's snapshot, scrape any one of them
+    return Response(renderMetrics(), mimetype="text/plain; version=0.0.4")
+
+
+@api.route("/api/v1/webhook/stats", methods=["GET"])
+def webhookStats():
+    # depth and utilisation show how far the event workers are behind LINE
+    return jsonify(eventQueueStats())
+
+
+@api.route("/api/v1/health/mongo", methods=["GET"])
+def mongoHealthCheck():
+    # ping plus this worker's connection pool counters
+    health = mongoHealth()
+    return jsonify(health), 200 if health["status"] == "ok" else 503
+
+
+def reportRange(data):
+    # ?month=2024-09, or ?from=2024-09-01&to=2024-09-15 with both days included,
+    # in the company's own timezone
+    tz = getTimezone(data.get("company"))
+    if data.get("month"):
+        start = datetime.strptime(data["month"], "%Y-%m").replace(tzinfo=tz)
+        end = (start + timedelta(days=32)).replace(day=1)
+    else:
+        if not data.get("from") or not data.get("to"):
+            raise ValueError("month, or from and to, is required")
+        start = datetime.strptime(data["from"], "%Y-%m-%d").replace(tzinfo=tz)
+        end = datetime.strptime(data["to"], "%Y-%m-%d").replace(tzinfo=tz)
+        end += timedelta(days=1)
+    if end <= start:
+        raise ValueError("to must not be before from")
+    return start, end
+
+
+@api.route("/api/v1/attendance/report", methods=["GET", "POST"])
+def attendanceReport():
+    # per employee and day: first in, last out, hours and lateness against an auto-calendar
+    data = {**request.args.to_dict(), **(request.get_json(silent=True) or {})}
+    try:
+        start, end = reportRange(data)
+    except ValueError as e:
+        return jsonify({"message": "Invalid report range: " + str(e)}), 400
+
+    # the schedule comes in the body, or by the ETag of a schedule this server already solved
+    schedule = data.get("schedule")
+    if schedule is None and data.get("schedule_key"):
+        solution = get_cached_solution(data["schedule_key"])
+        if solution is None:
+            return jsonify({"message": "Schedule not found."}), 404
+        schedule = solution["schedule"]
+    month = start.strftime("%Y-%m")
+    if (end - timedelta(days=1)).strftime("%Y-%m") != month:
+        # Day N of a schedule only maps to a date inside a single month
+        schedule = None
+
+    userIds = request.args.getlist("userId") or data.get("userIds")
+    rows = iterAttendanceReport(
+        start,
+        end,
+        companyName=data.get("company"),
+        userIds=userIds,
+        schedule=schedule,
+        month=month,
+        startTimes=data.get("shift_starts"),
+    )
+    label = data.get("month") or f"{data['from']}_{data['to']}"
+    if data.get("format", "csv") == "ndjson":
+        return Response(stream_with_context(streamNdjson(rows)), mimetype="application/x-ndjson")
+    return Response(
+        stream_with_context(streamCsv(rows)),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename=attendance-{label}.csv"},
+    )
+
+
+@api.route("/test", methods=["POST"])
 def test():
     replyMsg = insertCompanyUser()
     return replyMsg
 
 
-@app.route("/schedule", methods=["GET"])
-def testGetCalendar():
-    # define data
-    employees = define_employees()
-    shift_requirements = define_shift_requirements()
-    max_consecutive_days = 5
+def scheduleInputs(data=None):
+    # request bodies may override the built-in roster, otherwise fall back to it
+    data = data or {}
+    if not isinstance(data, dict):
+        raise ValueError("the request body must be an object")
+    calendar = autoCalendar()
+    return {
+        "employees": data.get("employees") or calendar.define_employees(),
+        "shift_requirements": data.get("shift_requirements")
+        or calendar.define_shift_requirements(),
+        "max_consecutive_days": int(data.get("max_consecutive_days", 5)),
+        "weights": data.get("weights") or calendar.OBJECTIVE_WEIGHTS,
+        "engine": data.get("engine") or request.args.get("engine", autoCalendarEngine),
+    }
+
+
+def validateEngine(engine):
+    # "auto" picks the MILP for small blocks and the heuristic for large ones
+    if engine != "auto" and engine not in autoCalendar().SCHEDULE_ENGINES:
+        raise ValueError(f"unknown engine {engine}")
+
 
-    # create optimize problem
-    prob = create_problem()
+def solverOptions(data=None):
+    # per-request solver controls, anything left out falls back to the AUTO_CALENDAR_* env
+    data = data or {}
 
-    # define var
-    schedule = define_variables(employees, shift_requirements)
+    def param(name, cast):
+        value = data.get(name, request.args.get(name))
+        return cast(value) if value not in (None, "") else None
 
-    # add condition
-    is_five_day_streak, is_one_day_streak = add_constraints(
-        prob, schedule, employees, shift_requirements, max_consecutive_days
+    options = {
+        "time_limit": param("time_budget", float),
+        "gap": param("gap", float),
+        "threads": param("threads", int),
+        "solver": param("solver", str),
+    }
+    if options["time_limit"] is not None and options["time_limit"] <= 0:
+        raise ValueError("time_budget must be positive")
+    if options["gap"] is not None and not 0 <= options["gap"] < 1:
+        raise ValueError("gap must be between 0 and 1")
+    if options["threads"] is not None and options["threads"] < 1:
+        raise ValueError("threads must be at least 1")
+    solver = options["solver"]
+    if solver is not None and not autoCalendar().is_solver_available(solver):
+        raise ValueError(f"solver {options['solver']} is not available")
+    return options
+
+
+def scheduleView():
+    # ?format=compact&encoding=bitset&from_day=8&to_day=14&employee=A&employee=B,
+    # so a client can fetch a week or one person instead of the whole month
+    def day(name):
+        value = request.args.get(name)
+        return int(value) if value not in (None, "") else None
+
+    view = {
+        "format": request.args.get("format", "nested"),
+        "encoding": request.args.get("encoding", "bitset"),
+        "first_day": day("from_day"),
+        "last_day": day("to_day"),
+        "employees": request.args.getlist("employee"),
+    }
+    if view["format"] not in ("nested", "compact"):
+        raise ValueError(f"unknown format {view['format']}")
+    if view["format"] == "compact" and view["encoding"] not in ("bitset", "rle"):
+        raise ValueError(f"unknown encoding {view['encoding']}")
+    return view
+
+
+def isFullView(view):
+    return view["format"] == "nested" and not (
+        view["first_day"] or view["last_day"] or view["employees"]
     )
 
-    # add oject function
-    add_objective_function(
-        prob, schedule, employees, shift_requirements, is_five_day_streak, is_one_day_streak
+
+def renderSchedule(schedule, view, employees=None):
+    if schedule is None or isFullView(view):
+        return schedule
+    if view["format"] == "compact":
+        return scheduleFormat().compact_schedule(
+            schedule,
+            employees,
+            view["first_day"],
+            view["last_day"],
+            view["employees"],
+            view["encoding"],
+        )
+    return scheduleFormat().filter_schedule(
+        schedule, view["first_day"], view["last_day"], view["employees"]
     )
 
-    # solve problem
-    solve_problem(prob)
 
-    # get result
-    schedule_result = get_schedule_result(schedule, employees, shift_requirements)
+def solutionEtag(key, view):
+    # one validator per representation; the full nested view keeps the plain key
+    etag = key + "-solver" if request.args.get("include") == "solver" else key
+    if not isFullView(view):
+        etag += "-" + hashlib.sha1(json.dumps(view, sort_keys=True).encode()).hexdigest()[:12]
+    return etag
 
-    return jsonify(schedule_result)
 
+def unsolvedResponse(stats):
+    # out of time may work with a larger time_budget, the other statuses are 503
+    response = jsonify(
+        {"message": "No schedule found, solver status: " + stats["status"], "solver": stats}
+    )
+    response.status_code = 504 if stats["status"] == "Not Solved" else 503
+    response.headers["X-Solver-Status"] = stats["status"]
+    return response
 
-@app.route("/api/v1/auto_calendar", methods=["GET"])
-def getCalendar():
-    # define data
-    employees = define_employees()
-    shift_requirements = define_shift_requirements()
-    max_consecutive_days = 5
 
-    # create optimize problem
-    prob = create_problem()
+def solutionResponse(solution, key, view, employees=None):
+    # ?include=solver returns the solver report next to the schedule, the headers always carry it
+    stats = solution["solver"]
+    if not is_solved(solution):
+        return unsolvedResponse(stats)
+    try:
+        schedule = renderSchedule(solution["schedule"], view, employees)
+    except ValueError as e:
+        response = jsonify({"message": "Invalid schedule view: " + str(e)})
+        response.status_code = 400
+        return response
+    if request.args.get("include") == "solver":
+        response = jsonify({**solution, "schedule": schedule})
+    else:
+        response = jsonify(schedule)
+    response.set_etag(solutionEtag(key, view))
+    response.headers["X-Solver-Status"] = stats["status"]
+    for header, name in (
+        ("X-Solver-Objective", "objective"),
+        ("X-Solver-Gap", "gap"),
+        ("X-Solver-Time", "wall_time"),
+    ):
+        if stats.get(name) is not None:
+            response.headers[header] = f"{stats[name]:g}"
+    return response
+
+
+def useDecompose(value=None):
+    # independent shift blocks are solved in parallel unless asked otherwise
+    if value is None:
+        value = request.args.get("decompose", autoCalendarDecompose)
+    return str(value).lower() not in ("0", "false")
+
+
+def buildSchedule():
+    inputs = scheduleInputs()
+    try:
+        validateEngine(inputs["engine"])
+        options = solverOptions()
+        view = scheduleView()
+    except ValueError as e:
+        return jsonify({"message": "Invalid scheduling request: " + str(e)}), 400
+
+    # same inputs always give the same key, which doubles as the ETag
+    key = schedule_fingerprint(**inputs, options=options)
+    etag = solutionEtag(key, view)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+    else:
+        decompose = useDecompose()
+        solution = get_or_solve_solution(
+            key,
+            lambda: autoCalendar().solve_schedule(
+                **inputs,
+                decompose=decompose,
+                max_workers=autoCalendarWorkers,
+                options=options,
+            ),
+        )
+        response = solutionResponse(solution, key, view, inputs["employees"])
+
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def jobResponse(job, status=200):
+    body = dict(job)
+    if job["status"] == "done":
+        solution = get_cached_solution(job["key"]) or {}
+        try:
+            body["result"] = renderSchedule(solution.get("schedule"), scheduleView())
+        except ValueError as e:
+            return jsonify({"message": "Invalid schedule view: " + str(e)}), 400
+        body["solver"] = solution.get("solver")
+    return jsonify(body), status
+
+
+@api.route("/schedule", methods=["GET"])
+def testGetCalendar():
+    return buildSchedule()
 
-    # add var
-    schedule = define_variables(employees, shift_requirements)
 
-    # add condition
-    is_five_day_streak, is_one_day_streak = add_constraints(
-        prob, schedule, employees, shift_requirements, max_consecutive_days
-    )
+@api.route("/api/v1/auto_calendar", methods=["GET"])
+def getCalendar():
+    return buildSchedule()
+
 
-    # add oject function
-    add_objective_function(
-        prob, schedule, employees, shift_requirements, is_five_day_streak, is_one_day_streak
+@api.route("/api/v1/auto_calendar/resolve", methods=["POST"])
+def resolveCalendar():
+    # re-plan a published schedule after a small change instead of solving from scratch
+    data = request.get_json(silent=True) or {}
+    calendar = autoCalendar()
+    try:
+        inputs = scheduleInputs(data)
+        options = solverOptions(data)
+        view = scheduleView()
+        previous_key = schedule_fingerprint(**inputs)
+        calendar.validate_roster(
+            inputs["employees"], inputs["shift_requirements"], inputs["weights"]
+        )
+        if not isinstance(data.get("delta") or {}, dict):
+            raise ValueError("delta must be an object")
+        employees, shift_requirements, changes = calendar.apply_schedule_delta(
+            inputs["employees"], inputs["shift_requirements"], data.get("delta") or {}
+        )
+        calendar.validate_roster(employees, shift_requirements)
+        # null reopens the whole month
+        window = data.get("window", 3)
+        if window is not None and (type(window) is not int or window < 0):
+            raise ValueError("window must be a non-negative integer or null")
+        if not isinstance(data.get("previous") or {}, dict):
+            raise ValueError("previous must be a schedule object")
+    except (AttributeError, KeyError, IndexError, TypeError, ValueError) as e:
+        return jsonify({"message": "Invalid schedule delta: " + str(e)}), 400
+
+    decompose = useDecompose(data.get("decompose"))
+    previous_result = data.get("previous")
+    if not previous_result:
+        previous = get_or_solve_solution(
+            previous_key,
+            lambda: calendar.solve_schedule(
+                **inputs, decompose=decompose, max_workers=autoCalendarWorkers
+            ),
+        )
+        if not is_solved(previous):
+            return unsolvedResponse(previous["solver"])
+        previous_result = previous["schedule"]
+    inputs.update(employees=employees, shift_requirements=shift_requirements)
+    key = resolve_fingerprint(
+        schedule_fingerprint(**inputs, options=options), previous_result, changes, window
     )
+    solution = get_or_solve_solution(
+        key,
+        lambda: calendar.resolve_schedule(
+            employees,
+            shift_requirements,
+            inputs["max_consecutive_days"],
+            previous_result,
+            changes,
+            window=window,
+            weights=inputs["weights"],
+            options=options,
+        ),
+    )
+    return solutionResponse(solution, key, view, employees)
+
+
+@api.route("/api/v1/auto_calendar/jobs", methods=["POST"])
+def createCalendarJob():
+    data = request.get_json(silent=True) or {}
+    try:
+        inputs = scheduleInputs(data)
+        validateEngine(inputs["engine"])
+        autoCalendar().validate_roster(
+            inputs["employees"], inputs["shift_requirements"], inputs["weights"]
+        )
+        inputs["options"] = solverOptions(data)
+        timeLimit = data.get("time_limit")
+        timeLimit = float(timeLimit) if timeLimit not in (None, "") else None
+        if timeLimit is not None and not timeLimit > 0:
+            raise ValueError("time_limit must be positive")
+        key = schedule_fingerprint(**inputs)
+    except (TypeError, ValueError) as e:
+        return jsonify({"message": "Invalid scheduling request: " + str(e)}), 400
+
+    inputs["decompose"] = useDecompose(data.get("decompose"))
+    inputs["max_workers"] = autoCalendarWorkers
+    try:
+        job = submit_job(key, inputs, timeLimit)
+    except queue.Full:
+        return jsonify({"message": "Scheduling queue is full, please retry later."}), 503, {
+            "Retry-After": "5"
+        }
+
+    response, status = jobResponse(job, 202)
+    response.headers["Location"] = url_for("api.getCalendarJob", job_id=job["id"])
+    return response, status
 
-    # solve problem
-    solve_problem(prob)
 
-    # get result
-    schedule_result = get_schedule_result(schedule, employees, shift_requirements)
+@api.route("/api/v1/auto_calendar/jobs/<job_id>", methods=["GET"])
+def getCalendarJob(job_id):
+    # ?wait=N long-polls for up to N seconds until the job finishes
+    wait = min(request.args.get("wait", 0, type=float), 60)
+    job = wait_for_job(job_id, wait) if wait > 0 else get_job(job_id)
+    if job is None:
+        return jsonify({"message": "Job not found."}), 404
+    return jobResponse(job)
 
-    return jsonify(schedule_result)
 
+@api.route("/api/v1/auto_calendar/jobs/<job_id>", methods=["DELETE"])
+def cancelCalendarJob(job_id):
+    job = cancel_job(job_id)
+    if job is None:
+        return jsonify({"message": "Job not found."}), 404
+    return jobResponse(job)
 
-@app.route("/", defaults={"path": ""})
-@app.route("/<path:path>")
+
+@api.route("/", defaults={"path": ""})
+@api.route("/<path:path>")
 def serve_react_app(path):
-    if path != "" and os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
-    else:
-        return send_from_directory(app.static_folder, "index.html")
+    return sendAssetOrIndex(current_app.extensions["assetManifest"], path)
+
 
+app = createApp()
 
 if __name__ == "__main__":
     app.run()
@@ -0,0 +1,46 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.auto_calendar import (
+    add_constraints,
+    add_objective_function,
+    compile_roster,
+    create_problem,
+    define_variables,
+)
+from benchmarks.synthetic_roster import generate_roster
+
+
+def build_model(employees, shift_requirements, max_consecutive_days=5):
+    roster = compile_roster(employees, shift_requirements)
+    prob = create_problem()
+    schedule = define_variables(employees, shift_requirements)
+    is_five_day_streak, is_one_day_streak = add_constraints(
+        prob, schedule, employees, shift_requirements, max_consecutive_days, roster
+    )
+    add_objective_function(
+        prob,
+        schedule,
+        employees,
+        shift_requirements,
+        is_five_day_streak,
+        is_one_day_streak,
+        roster,
+    )
+    return prob
+
+
+if __name__ == "__main__":
+    sizes = [int(size) for size in sys.argv[1:]] or [25, 250, 2500]
+    print(f"{'employees':>10} {'variables':>10} {'constraints':>12} {'build (s)':>10}")
+    for size in sizes:
+        employees, shift_requirements = generate_roster(size)
+        start = time.perf_counter()
+        prob = build_model(employees, shift_requirements)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{size:>10} {len(prob.variables()):>10} {len(prob.constraints):>12} {elapsed:>10.3f}"
+        )
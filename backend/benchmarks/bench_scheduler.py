@@ -0,0 +1,232 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+import warnings
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pulp
+from utils.auto_calendar import (
+    add_constraints,
+    add_objective_function,
+    compile_roster,
+    create_problem,
+    define_variables,
+    get_schedule_result,
+    solve_problem,
+)
+from benchmarks.synthetic_roster import generate_roster
+
+PHASES = [
+    "compile_roster",
+    "define_variables",
+    "add_constraints",
+    "add_objective_function",
+    "solve_problem",
+    "get_schedule_result",
+]
+DEFAULT_SIZES = [20, 250, 1000, 5000]
+DEFAULT_DAYS = [7, 31, 90]
+
+
+def run_phases(employees, shift_requirements, max_consecutive_days, options, solve, trace):
+    # run the MILP pipeline one phase at a time, recording time and traced peak memory
+    timings, memory, state = {}, {}, {}
+
+    def phase(name, func):
+        if trace:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        result = func()
+        timings[name] = time.perf_counter() - start
+        if trace:
+            memory[name] = tracemalloc.get_traced_memory()[1] / 2**20
+        return result
+
+    roster = phase("compile_roster", lambda: compile_roster(employees, shift_requirements))
+    prob = create_problem()
+    schedule = phase("define_variables", lambda: define_variables(employees, shift_requirements))
+    is_five, is_one = phase(
+        "add_constraints",
+        lambda: add_constraints(
+            prob, schedule, employees, shift_requirements, max_consecutive_days, roster
+        ),
+    )
+    phase(
+        "add_objective_function",
+        lambda: add_objective_function(
+            prob, schedule, employees, shift_requirements, is_five, is_one, roster
+        ),
+    )
+    state.update(variables=prob.numVariables(), constraints=prob.numConstraints())
+    if solve:
+        stats = phase("solve_problem", lambda: solve_problem(prob, options=options))
+        state.update(status=stats["status"], objective=stats["objective"], gap=stats["gap"])
+        phase(
+            "get_schedule_result",
+            lambda: get_schedule_result(schedule, employees, shift_requirements),
+        )
+    return timings, memory, state
+
+
+def run_case(num_employees, num_days, seed, max_consecutive_days, options, solve, trace):
+    warnings.simplefilter("ignore")
+    employees, shift_requirements = generate_roster(num_employees, num_days, seed)
+    timings, _, state = run_phases(
+        employees, shift_requirements, max_consecutive_days, options, solve, False
+    )
+    # ru_maxrss is KiB on Linux; the children figure is the CBC process
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    solver_peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    memory = {}
+    if trace:
+        # tracemalloc slows PuLP down several times, so memory gets its own build-only pass
+        tracemalloc.start()
+        _, memory, _ = run_phases(
+            employees, shift_requirements, max_consecutive_days, options, False, True
+        )
+        tracemalloc.stop()
+
+    return {
+        "employees": num_employees,
+        "days": num_days,
+        "seed": seed,
+        "solved": solve,
+        **state,
+        "timings": timings,
+        "total_time": sum(timings.values()),
+        "traced_peak_mb": memory,
+        "peak_rss_mb": peak_rss,
+        "solver_peak_rss_mb": solver_peak_rss,
+    }
+
+
+def run_isolated(*args):
+    # a fresh process per case keeps peak RSS from leaking between cases
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        return pool.apply(run_case, args)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(baseline, current, threshold):
+    # match cases by size and report every phase that got slower than threshold x baseline
+    baseline_cases = {(case["employees"], case["days"]): case for case in baseline["results"]}
+    regressions = []
+    print(f"\nvs {baseline['meta'].get('commit')} (threshold {threshold:.2f}x)")
+    for case in current["results"]:
+        base = baseline_cases.get((case["employees"], case["days"]))
+        if base is None:
+            continue
+        names = PHASES + (["total_time"] if case["solved"] == base["solved"] else [])
+        for name in names:
+            before = base["timings"].get(name) if name != "total_time" else base[name]
+            after = case["timings"].get(name) if name != "total_time" else case[name]
+            if not before or after is None:
+                continue
+            ratio = after / before
+            flag = ""
+            # sub-10ms phases are too noisy to flag
+            if ratio > threshold and after - before > 0.01:
+                regressions.append((case["employees"], case["days"], name, ratio))
+                flag = "  REGRESSION"
+            print(
+                f"{case['employees']:>6} x {case['days']:>3}d {name:<24} "
+                f"{before:>9.3f}s -> {after:>9.3f}s {ratio:>6.2f}x{flag}"
+            )
+    return regressions
+
+
+def print_case(case):
+    timings = " ".join(f"{case['timings'].get(name, 0):>9.3f}" for name in PHASES)
+    print(
+        f"{case['employees']:>6} {case['days']:>4} "
+        f"{case['variables']:>9} {case['constraints']:>9} {timings} "
+        f"{case['total_time']:>9.3f} {case['peak_rss_mb']:>8.1f} "
+        f"{case.get('status', '-'):>10}"
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the auto calendar MILP pipeline.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--days", type=int, nargs="+", default=DEFAULT_DAYS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-consecutive-days", type=int, default=5)
+    parser.add_argument("--no-solve", action="store_true", help="only time model building")
+    parser.add_argument("--time-limit", type=float, default=60, help="CBC seconds per case")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument(
+        "--trace-memory", action="store_true", help="per-phase tracemalloc peaks (slower)"
+    )
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results from an earlier commit")
+    parser.add_argument("--threshold", type=float, default=1.2)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    options = {"time_limit": args.time_limit, "threads": args.threads}
+    header = " ".join(f"{name[:9]:>9}" for name in PHASES)
+    print(
+        f"{'staff':>6} {'days':>4} {'vars':>9} {'rows':>9} {header} {'total':>9} "
+        f"{'rss (MB)':>8} {'status':>10}"
+    )
+
+    results = []
+    for num_employees in args.sizes:
+        for num_days in args.days:
+            case = run_isolated(
+                num_employees,
+                num_days,
+                args.seed,
+                args.max_consecutive_days,
+                options,
+                not args.no_solve,
+                args.trace_memory,
+            )
+            print_case(case)
+            results.append(case)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "pulp": pulp.__version__,
+            "machine": platform.platform(),
+            "cpus": os.cpu_count(),
+            "options": options,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare_results(json.load(f), report, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} phase(s) regressed")
+            sys.exit(1)
@@ -0,0 +1,184 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+# Local stand-in for the LINE Messaging API and LINE Login, for load tests without network.
+# Point the app at it with LINE_API_ENDPOINT, LINE_TOKEN_URL and LINE_PROFILE_URL.
+
+
+def percentiles(values, points=(50, 95, 99)):
+    # nearest-rank, on milliseconds
+    if not values:
+        return {f"p{point}": None for point in points}
+    ordered = sorted(values)
+    return {
+        f"p{point}": round(ordered[min(len(ordered) - 1, int(len(ordered) * point / 100))], 2)
+        for point in points
+    }
+
+
+class StubState:
+    def __init__(self, latency_ms, jitter_ms, error_rate, error_status, seed):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = {}
+            self.injected_errors = 0
+            self.replies = {"ok": 0, "failed": 0, "other": 0}
+            # webhook send -> reply arrival, from the timestamp the load generator puts in the token
+            self.reply_latencies = []
+
+    def delay(self):
+        with self.lock:
+            jitter = self.random.uniform(-self.jitter_ms, self.jitter_ms)
+            fail = self.random.random() < self.error_rate
+            if fail:
+                self.injected_errors += 1
+        time.sleep(max(self.latency_ms + jitter, 0) / 1000)
+        return fail
+
+    def count(self, route):
+        with self.lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+
+    def record_reply(self, body):
+        texts = [message.get("text", "") for message in body.get("messages", [])]
+        outcome = "other"
+        if any("成功" in text for text in texts):
+            outcome = "ok"
+        elif any("失敗" in text for text in texts):
+            outcome = "failed"
+        latency = None
+        parts = body.get("replyToken", "").split(".")
+        if len(parts) == 3 and parts[0] == "lt":
+            latency = (time.time_ns() - int(parts[1])) / 1e6
+        with self.lock:
+            self.replies[outcome] += 1
+            if latency is not None:
+                self.reply_latencies.append(latency)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "requests": dict(self.requests),
+                "injected_errors": self.injected_errors,
+                "replies": dict(self.replies),
+                "reply_latency_ms": {
+                    "count": len(self.reply_latencies),
+                    **percentiles(self.reply_latencies),
+                    "max": round(max(self.reply_latencies), 2) if self.reply_latencies else None,
+                },
+            }
+
+
+def make_handler(state):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def read_body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length) if length else b""
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path == "/__stats":
+                return self.send_json(200, state.snapshot())
+            state.count("GET " + path)
+            if state.delay():
+                return self.send_json(state.error_status, {"message": "injected error"})
+            if path == "/v2/profile" or path.startswith("/v2/bot/profile/"):
+                user_id = path.rsplit("/", 1)[-1] if path.startswith("/v2/bot/") else "Ustub"
+                return self.send_json(
+                    200,
+                    {
+                        "userId": user_id,
+                        "displayName": "Load Test",
+                        "pictureUrl": "https://example.invalid/picture.png",
+                        "statusMessage": "",
+                    },
+                )
+            self.send_json(404, {"message": "Not found"})
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            body = self.read_body()
+            if path == "/__reset":
+                state.reset()
+                return self.send_json(200, {})
+            state.count("POST " + path)
+            if state.delay():
+                return self.send_json(state.error_status, {"message": "injected error"})
+            if path == "/v2/bot/message/reply":
+                state.record_reply(json.loads(body or b"{}"))
+                return self.send_json(200, {})
+            if path == "/oauth2/v2.1/token":
+                return self.send_json(
+                    200,
+                    {
+                        "access_token": "stub-access-token",
+                        "token_type": "Bearer",
+                        "expires_in": 2592000,
+                        "refresh_token": "stub-refresh-token",
+                        "scope": "profile openid",
+                        "id_token": "stub-id-token",
+                    },
+                )
+            self.send_json(404, {"message": "Not found"})
+
+    return StubHandler
+
+
+def start_stub(port=0, latency_ms=30, jitter_ms=10, error_rate=0.0, error_status=500, seed=0):
+    # returns the running server; port 0 picks a free one, see server.server_address
+    state = StubState(latency_ms, jitter_ms, error_rate, error_status, seed)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, name="line-stub", daemon=True).start()
+    return server
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Local LINE Messaging API / LINE Login stub.")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=30)
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = start_stub(
+        args.port, args.latency_ms, args.jitter_ms, args.error_rate, args.error_status, args.seed
+    )
+    print(f"LINE stub on http://127.0.0.1:{server.server_address[1]}, stats at /__stats")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,472 @@
+import argparse
+import base64
+import hashlib
+import hmac
+import importlib.util
+import json
+import os
+import platform
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+from benchmarks.line_stub import percentiles, start_stub
+
+CHANNEL_SECRET = "load-test-secret"
+COMPANIES = ["開心公司", "快樂公司", "晴天公司"]
+ENDPOINTS = {
+    "callback": "/callback",
+    "oauth": "/auth/line/callback",
+    "calendar": "/api/v1/auto_calendar",
+}
+# what a phone or the React app asks for; most of these are schedule cache hits
+CALENDAR_QUERIES = [
+    "",
+    "format=compact",
+    "format=compact&from_day=1&to_day=7",
+    "include=solver",
+]
+METRIC_LINE = re.compile(r"^(\w+)_(sum|count)(\{[^}]*\})? (\S+)$")
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def sign(body):
+    digest = hmac.new(CHANNEL_SECRET.encode(), body, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode()
+
+
+def poisson_times(rate, duration, rng):
+    times, t = [], 0.0
+    while rate > 0:
+        t += rng.expovariate(rate)
+        if t >= duration:
+            break
+        times.append(t)
+    return times
+
+
+def plan_traffic(args, rng):
+    # (seconds from start, kind, spec), open loop: requests go out on schedule whatever the
+    # server does, so a slow server shows up as latency instead of as fewer requests
+    duration = args.duration
+    users = [f"U{rng.getrandbits(128):032x}" for _ in range(args.users)]
+    events = []
+    if "callback" in args.scenarios:
+        for i, user in enumerate(users):
+            # everyone registers in the first tenth of the run...
+            company = rng.choice(COMPANIES)
+            profile = f"建立個人檔案:{company} 員工{i} {100000 + i} 1990/01/01"
+            events.append((rng.uniform(0, duration * 0.1), {"user": user, "text": profile}))
+            # ...then clocks in around the hour, most of them within a few minutes of it
+            punch = min(max(rng.gauss(0.55, 0.12), 0.1), 0.999) * duration
+            if rng.random() < args.postback_share:
+                events.append((punch, {"user": user, "postback": "action=punch"}))
+            else:
+                events.append((punch, {"user": user, "text": "打卡"}))
+
+    plan = []
+
+    def add_webhook(batch):
+        # event ids are fixed here so a redelivery repeats the same ids and reply tokens
+        spec = {
+            "events": [event for _, event in batch],
+            "ids": [uuid.UUID(int=rng.getrandbits(128)).hex for _ in batch],
+        }
+        plan.append((batch[0][0], "callback", spec))
+
+    # LINE puts events that arrive close together into one webhook request
+    events.sort(key=lambda item: item[0])
+    batch = []
+    for t, event in events:
+        if batch and (
+            t - batch[0][0] > args.batch_window_ms / 1000 or len(batch) >= args.events_per_webhook
+        ):
+            add_webhook(batch)
+            batch = []
+        batch.append((t, event))
+    if batch:
+        add_webhook(batch)
+    for t, _, spec in list(plan):
+        if rng.random() < args.redelivery_share:
+            plan.append((min(t + 1.0, duration), "callback", {**spec, "redelivery": True}))
+
+    if "oauth" in args.scenarios:
+        for t in poisson_times(args.oauth_rate, duration, rng):
+            plan.append((t, "oauth", {"code": uuid.UUID(int=rng.getrandbits(128)).hex}))
+    if "calendar" in args.scenarios:
+        for t in poisson_times(args.calendar_rate, duration, rng):
+            query = rng.choice(CALENDAR_QUERIES)
+            if rng.random() < args.calendar_fresh_share:
+                # a new solver budget is a new cache key, so this one is solved from scratch
+                query += f"&time_budget={rng.randint(20, 10000)}"
+            plan.append((t, "calendar", {"query": query.lstrip("&")}))
+
+    plan.sort(key=lambda item: item[0])
+    return plan
+
+
+def build_webhook(spec, scheduled_ns, seq):
+    events = []
+    for i, (event, event_id) in enumerate(zip(spec["events"], spec["ids"])):
+        body = {
+            "mode": "active",
+            "timestamp": scheduled_ns // 1_000_000,
+            "source": {"type": "user", "userId": event["user"]},
+            "webhookEventId": event_id,
+            "deliveryContext": {"isRedelivery": bool(spec.get("redelivery"))},
+            # the stub reads the send time back out of the token for end-to-end latency
+            "replyToken": f"lt.{scheduled_ns}.{seq}-{i}",
+        }
+        if "postback" in event:
+            body.update(type="postback", postback={"data": event["postback"]})
+        else:
+            body.update(
+                type="message",
+                message={"id": event_id[:18], "type": "text", "text": event["text"]},
+            )
+        events.append(body)
+    return json.dumps({"destination": "Uloadtest", "events": events}, ensure_ascii=False).encode()
+
+
+def send_request(session, app_url, kind, spec, scheduled_ns, seq):
+    # returns (status code, whether that counts as success)
+    if kind == "callback":
+        body = build_webhook(spec, scheduled_ns, seq)
+        response = session.post(
+            app_url + "/callback",
+            data=body,
+            headers={"Content-Type": "application/json", "X-Line-Signature": sign(body)},
+            timeout=30,
+        )
+        return response.status_code, response.status_code == 200
+    if kind == "oauth":
+        response = session.post(
+            f"{app_url}/auth/line/callback?code={spec['code']}&state=12345abcde",
+            allow_redirects=False,
+            timeout=30,
+        )
+        return response.status_code, response.status_code == 302
+    response = session.get(f"{app_url}/api/v1/auto_calendar?{spec['query']}", timeout=300)
+    return response.status_code, response.status_code in (200, 304)
+
+
+def run_load(app_url, plan, concurrency):
+    results = []
+    results_lock = threading.Lock()
+    local = threading.local()
+    start = time.perf_counter()
+    start_ns = time.time_ns()
+
+    def send(seq, offset, kind, spec):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        scheduled_ns = start_ns + int(offset * 1e9)
+        try:
+            status, ok = send_request(local.session, app_url, kind, spec, scheduled_ns, seq)
+        except requests.RequestException as e:
+            status, ok = type(e).__name__, False
+        # measured from when the request was due, so client-side queueing is not hidden
+        latency = (time.time_ns() - scheduled_ns) / 1e6
+        with results_lock:
+            results.append((kind, ok, status, latency))
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="load") as pool:
+        for seq, (offset, kind, spec) in enumerate(plan):
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, seq, offset, kind, spec)
+    return results, time.perf_counter() - start
+
+
+def summarize(results, elapsed):
+    summary = {}
+    for kind, path in ENDPOINTS.items():
+        rows = [row for row in results if row[0] == kind]
+        if not rows:
+            continue
+        latencies = [latency for _, _, _, latency in rows]
+        errors = sum(1 for _, ok, _, _ in rows if not ok)
+        statuses = {}
+        for _, _, status, _ in rows:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        summary[path] = {
+            "requests": len(rows),
+            "errors": errors,
+            "error_rate": round(errors / len(rows), 4),
+            "throughput": round(len(rows) / elapsed, 2),
+            **percentiles(latencies),
+            "max": round(max(latencies), 2),
+            "statuses": statuses,
+        }
+    return summary
+
+
+def wait_for_replies(stub, timeout):
+    # queue mode acks the webhook first, so give the workers time to send the last replies
+    deadline = time.monotonic() + timeout
+    last, stable_since = None, time.monotonic()
+    while time.monotonic() < deadline:
+        count = stub.state.snapshot()["reply_latency_ms"]["count"]
+        if count != last:
+            last, stable_since = count, time.monotonic()
+        elif time.monotonic() - stable_since > 2:
+            return
+        time.sleep(0.5)
+
+
+def scrape_phase_means(app_url):
+    # mean per series from the app's own /metrics, e.g. how /callback splits into its phases
+    try:
+        text = requests.get(app_url + "/metrics", timeout=10).text
+    except requests.RequestException:
+        return {}
+    sums, counts = {}, {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if not match or match.group(1) not in (
+            "line_webhook_seconds",
+            "line_event_seconds",
+            "mongo_operation_seconds",
+            "schedule_phase_seconds",
+        ):
+            continue
+        name = match.group(1) + (match.group(3) or "")
+        (sums if match.group(2) == "sum" else counts)[name] = float(match.group(4))
+    return {
+        name: {"count": int(counts[name]), "mean_ms": round(sums[name] / counts[name] * 1000, 2)}
+        for name in sorted(sums)
+        if counts.get(name)
+    }
+
+
+def app_environment(stub_url, mongo_uri, work_dir):
+    return {
+        "MONGO_URI": mongo_uri,
+        "CHANNEL_SECRET": CHANNEL_SECRET,
+        "CHANNEL_ACCESS_TOKEN": "load-test",
+        "LINE_API_ENDPOINT": stub_url,
+        "LINE_API_DATA_ENDPOINT": stub_url,
+        "LINE_TOKEN_URL": stub_url + "/oauth2/v2.1/token",
+        "LINE_PROFILE_URL": stub_url + "/v2/profile",
+        "LINE_LOGIN_CHANNEL_ID": "load-test",
+        "LINE_LOGIN_SECRET": "load-test",
+        "LINE_LOGIN_CALLBACK_URL": "http://127.0.0.1/auth/line/callback",
+        "SERVICE_URL": "http://127.0.0.1:3000",
+        "ENABLE_SWAGGER": "false",
+        "METRICS_DIR": os.path.join(work_dir, "metrics"),
+        "SCHEDULE_CACHE_DIR": os.path.join(work_dir, "schedule_cache"),
+        "SCHEDULE_JOB_DIR": os.path.join(work_dir, "schedule_jobs"),
+        "ATTENDANCE_SPOOL_PATH": os.path.join(work_dir, "punch_spool.jsonl"),
+    }
+
+
+def start_app(args, stub_url, work_dir):
+    if importlib.util.find_spec("gunicorn") is None:
+        sys.exit("gunicorn is not installed; start the app yourself and pass --app-url")
+    if args.mongo_uri.startswith("mongomock://") and importlib.util.find_spec("mongomock") is None:
+        sys.exit("mongomock is not installed; install it or pass --mongo-uri of a local mongod")
+
+    port = free_port()
+    env = {**os.environ, **app_environment(stub_url, args.mongo_uri, work_dir)}
+    log = open(os.path.join(work_dir, "app.log"), "w")
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "app:app",
+            "--chdir",
+            BACKEND_DIR,
+            "--workers",
+            str(args.workers),
+            "--threads",
+            str(args.threads),
+            "--bind",
+            f"127.0.0.1:{port}",
+        ],
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    app_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"gunicorn exited with {process.returncode}, see {log.name}")
+        try:
+            requests.get(app_url + "/api/v1/webhook/stats", timeout=1)
+            return process, app_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    sys.exit(f"gunicorn did not come up within 60s, see {log.name}")
+
+
+def print_report(report):
+    print(
+        f"\n{'endpoint':<24} {'requests':>8} {'errors':>7} {'err %':>6} {'req/s':>7} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+    )
+    for path, row in report["endpoints"].items():
+        print(
+            f"{path:<24} {row['requests']:>8} {row['errors']:>7} {row['error_rate'] * 100:>6.2f} "
+            f"{row['throughput']:>7.2f} {row['p50']:>8.1f} {row['p95']:>8.1f} {row['p99']:>8.1f} "
+            f"{row['max']:>8.1f}"
+        )
+    replies = report["line_stub"]["reply_latency_ms"]
+    if replies["count"]:
+        print(
+            f"{'webhook -> LINE reply':<24} {replies['count']:>8} {'':>7} {'':>6} {'':>7} "
+            f"{replies['p50']:>8.1f} {replies['p95']:>8.1f} {replies['p99']:>8.1f} "
+            f"{replies['max']:>8.1f}"
+        )
+    print(f"LINE replies by outcome: {report['line_stub']['replies']}")
+    if report["server_phases"]:
+        print(f"\n{'server phase (from /metrics)':<64} {'count':>8} {'mean ms':>9}")
+        for name, row in report["server_phases"].items():
+            print(f"{name:<64} {row['count']:>8} {row['mean_ms']:>9.2f}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Offline load test of /callback, /auth/line/callback and /api/v1/auto_calendar "
+        "against a local LINE stub and a local Mongo stand-in."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="gunicorn workers; 2 by default, and only 1 with mongomock://",
+    )
+    parser.add_argument("--threads", type=int, default=4, help="gunicorn threads per worker")
+    parser.add_argument(
+        "--app-url",
+        help="an already running app to test instead of starting gunicorn; it must be "
+        "configured with the environment printed at start",
+    )
+    parser.add_argument(
+        "--mongo-uri",
+        default="mongomock://",
+        help="mongomock:// keeps an in-memory database per worker, so it runs a single worker "
+        "(needs the mongomock package); use a local mongod, e.g. mongodb://127.0.0.1:27017, "
+        "to test several workers",
+    )
+    parser.add_argument(
+        "--scenarios",
+        nargs="+",
+        choices=list(ENDPOINTS),
+        default=list(ENDPOINTS),
+    )
+    parser.add_argument("--duration", type=float, default=60, help="seconds of traffic")
+    parser.add_argument("--users", type=int, default=200, help="employees who register and punch")
+    parser.add_argument("--events-per-webhook", type=int, default=5)
+    parser.add_argument("--batch-window-ms", type=float, default=100)
+    parser.add_argument("--postback-share", type=float, default=0.3)
+    parser.add_argument("--redelivery-share", type=float, default=0.02)
+    parser.add_argument("--oauth-rate", type=float, default=1.0, help="logins per second")
+    parser.add_argument("--calendar-rate", type=float, default=0.2, help="requests per second")
+    parser.add_argument("--calendar-fresh-share", type=float, default=0.1)
+    parser.add_argument("--concurrency", type=int, default=64, help="client threads")
+    parser.add_argument("--stub-port", type=int, default=8099)
+    parser.add_argument("--stub-latency-ms", type=float, default=30)
+    parser.add_argument("--stub-jitter-ms", type=float, default=10)
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--drain-timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+
+    # workers with separate in-memory databases would not see each other's users or
+    # webhook claims, and the report would measure those failures
+    in_memory = args.mongo_uri.startswith("mongomock://")
+    if args.workers is None:
+        args.workers = 1 if in_memory else 2
+    elif args.workers > 1 and in_memory:
+        parser.error("mongomock:// runs a single worker; use --mongo-uri of a local mongod")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    rng = random.Random(args.seed)
+    stub = start_stub(
+        args.stub_port,
+        args.stub_latency_ms,
+        args.stub_jitter_ms,
+        args.stub_error_rate,
+        seed=args.seed,
+    )
+    stub_url = f"http://127.0.0.1:{stub.server_address[1]}"
+    work_dir = tempfile.mkdtemp(prefix="load_test_")
+
+    process = None
+    if args.app_url:
+        app_url = args.app_url.rstrip("/")
+        print("Expecting the app to run with:")
+        for name, value in app_environment(stub_url, args.mongo_uri, work_dir).items():
+            print(f"  {name}={value}")
+    else:
+        process, app_url = start_app(args, stub_url, work_dir)
+
+    try:
+        plan = plan_traffic(args, rng)
+        print(f"{len(plan)} requests over {args.duration:g}s against {app_url}")
+        results, elapsed = run_load(app_url, plan, args.concurrency)
+        wait_for_replies(stub, args.drain_timeout)
+        report = {
+            "meta": {
+                "commit": git_commit(),
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "machine": platform.platform(),
+                "cpus": os.cpu_count(),
+                "workers": args.workers if process else None,
+                "threads": args.threads if process else None,
+                "args": vars(args),
+                "elapsed": round(elapsed, 2),
+            },
+            "endpoints": summarize(results, elapsed),
+            "line_stub": stub.state.snapshot(),
+            "server_phases": scrape_phase_means(app_url),
+        }
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        stub.shutdown()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nApp log and data in {work_dir}")
@@ -0,0 +1,56 @@
+import random
+
+SHIFT_SHARES = {"day": 0.5, "swing": 0.3, "night": 0.2}
+LEVEL_SHARES = {"senior": 0.2, "mid": 0.5, "junior": 0.3}
+
+
+def generate_roster(
+    num_employees,
+    num_days=31,
+    seed=0,
+    multi_shift_share=0.1,
+    leave_share=0.3,
+    coverage=0.6,
+):
+    # Same shape as define_employees() / define_shift_requirements(), off days are 1-based
+    rng = random.Random(seed)
+    shifts = list(SHIFT_SHARES)
+    employees = {}
+    for i in range(num_employees):
+        shift = rng.choices(shifts, weights=SHIFT_SHARES.values())[0]
+        level = rng.choices(list(LEVEL_SHARES), weights=LEVEL_SHARES.values())[0]
+        # every shift needs a senior each day, so each shift gets two seniors up front
+        # and the second one never takes leave
+        if i < 2 * len(shifts):
+            shift, level = shifts[i % len(shifts)], "senior"
+
+        off_days = []
+        if not len(shifts) <= i < 2 * len(shifts) and rng.random() < leave_share:
+            length = rng.randint(1, min(4, num_days))
+            start = rng.randint(1, num_days - length + 1)
+            off_days = list(range(start, start + length))
+        preferred_off_days = list(off_days)
+        for _ in range(rng.randint(0, 2)):
+            day = rng.randint(1, num_days)
+            if day not in preferred_off_days:
+                preferred_off_days.append(day)
+
+        employees[f"E{i}"] = {
+            "level": level,
+            "shift": shift,
+            "off_days": off_days,
+            "preferred_off_days": sorted(preferred_off_days),
+        }
+        if rng.random() < multi_shift_share:
+            employees[f"E{i}"]["shifts"] = sorted({shift, rng.choice(shifts)})
+
+    # weekends (days 6 and 7 of every week) need fewer people than weekdays
+    shift_requirements = {}
+    for shift in shifts:
+        size = sum(1 for emp in employees.values() if emp["shift"] == shift)
+        weekday = max(1, int(size * coverage))
+        weekend = max(1, int(size * coverage * 0.8))
+        shift_requirements[shift] = [
+            weekend if day % 7 in (5, 6) else weekday for day in range(num_days)
+        ]
+    return employees, shift_requirements
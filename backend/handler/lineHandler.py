@@ -0,0 +1,246 @@
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from handler.mongoHandler import claimWebhookEvent, insertCompanyUser, insertWorkAttendance
+from linebot.models import StickerSendMessage, TextSendMessage
+from utils.metrics import incCounter, observe, timer
+
+lineEventWorkers = int(os.getenv("LINE_EVENT_WORKERS", "8"))
+# "queue" acks the webhook at once and works through the events in the background
+lineWebhookMode = os.getenv("LINE_WEBHOOK_MODE", "queue")
+lineEventQueueSize = int(os.getenv("LINE_EVENT_QUEUE_SIZE", "1000"))
+lineEventDedupSize = int(os.getenv("LINE_EVENT_DEDUP_SIZE", "10000"))
+lineEventDedupTtl = int(os.getenv("LINE_EVENT_DEDUP_TTL", "86400"))
+
+_executor = None
+_executorPid = None
+_executorLock = threading.Lock()
+_eventQueue = None
+_eventQueuePid = None
+_eventQueueLock = threading.Lock()
+_eventStats = {}
+_recentEvents = OrderedDict()
+_recentEventsLock = threading.Lock()
+
+
+def getEventId(event):
+    # webhookEventId is unique per event; older payloads only have the message id
+    return event.get("webhookEventId") or event.get("message", {}).get("id")
+
+
+def isRecentEvent(eventId):
+    with _recentEventsLock:
+        seenAt = _recentEvents.get(eventId)
+        return seenAt is not None and time.monotonic() - seenAt < lineEventDedupTtl
+
+
+def claimEvent(event):
+    # this worker's recent ids first, then the TTL-indexed Mongo collection shared by all workers
+    eventId = getEventId(event)
+    if eventId is None:
+        return True
+    with _recentEventsLock:
+        seenAt = _recentEvents.get(eventId)
+        if seenAt is not None and time.monotonic() - seenAt < lineEventDedupTtl:
+            return False
+        # bounded, oldest first, so a redelivery storm cannot grow it without limit
+        _recentEvents[eventId] = time.monotonic()
+        _recentEvents.move_to_end(eventId)
+        while len(_recentEvents) > lineEventDedupSize:
+            _recentEvents.popitem(last=False)
+    return claimWebhookEvent(eventId)
+
+
+def usageReply():
+    emoji = [{"index": 10, "productId": "5ac1bfd5040ab15980c9b435", "emojiId": "009"}]
+    message = "歡迎使用假勤寶寶系統$\n假勤寶寶主要是管理您上下班時間以及請假相關的事宜\n\n注意：在使用之前，請先建檔，建檔訊息格式為： 建立個人檔案:[公司名稱] [姓名] [工號] [生日] (ex. 建立個人檔案:開心公司 假勤寶寶 123456 1998/01/01)"
+    return [
+        TextSendMessage(message, emojis=emoji),
+        StickerSendMessage(sticker_id="11825378", package_id="6632"),
+    ]
+
+
+def unknownCommandReply():
+    emoji = [{"index": 14, "productId": "5ac1bfd5040ab15980c9b435", "emojiId": "005"}]
+    message = "指令超出本寶寶的理解範圍了啦$ 等本寶寶學習一下!"
+    return [
+        TextSendMessage(message, emojis=emoji),
+        StickerSendMessage(sticker_id="52002750", package_id="11537"),
+    ]
+
+
+def unknownMessageReply():
+    emoji = [{"index": 12, "productId": "5ac1bfd5040ab15980c9b435", "emojiId": "005"}]
+    message = "超出本寶寶的理解範圍了啦$ 等本寶寶學習一下!"
+    return [
+        TextSendMessage(message, emojis=emoji),
+        StickerSendMessage(sticker_id="52002750", package_id="11537"),
+    ]
+
+
+def handleText(event, msg):
+    if msg[:7] == "建立個人檔案:":
+        return insertCompanyUser(event, msg[7:])
+    elif msg == "打卡":
+        return insertWorkAttendance(event)
+    elif msg == "使用說明" or msg == "如何使用":
+        return usageReply()
+    return unknownCommandReply()
+
+
+def handlePostback(event):
+    # rich menu buttons send "action=punch" style data instead of typed text
+    data = dict(
+        item.split("=", 1) for item in event["postback"].get("data", "").split("&") if "=" in item
+    )
+    action = data.get("action")
+    if action == "punch":
+        return insertWorkAttendance(event)
+    elif action == "help":
+        return usageReply()
+    return unknownCommandReply()
+
+
+def buildReply(event):
+    eventType = event.get("type")
+    if eventType == "message":
+        if event["message"]["type"] == "text":
+            return handleText(event, event["message"]["text"])
+        return unknownMessageReply()
+    elif eventType == "follow":
+        return usageReply()
+    elif eventType == "postback":
+        return handlePostback(event)
+    # unfollow, join, leave and the rest need no reply
+    return None
+
+
+def handleEvent(lineBotApi, event):
+    eventType = event.get("type", "unknown")
+    try:
+        with timer("line_event_seconds", phase="claim"):
+            claimed = claimEvent(event)
+        if not claimed:
+            incCounter("line_events_total", type=eventType, outcome="duplicate")
+            print("Skip redelivered event: " + str(getEventId(event)))
+            return
+        tk = event.get("replyToken")
+        # the handlers are where the Mongo reads and writes happen
+        with timer("line_event_seconds", phase="handle"):
+            reply = buildReply(event)
+        if reply is None or not tk:
+            # unfollow and similar events carry no reply token
+            incCounter("line_events_total", type=eventType, outcome="noReply")
+            return
+        with timer("line_event_seconds", phase="reply"):
+            if isinstance(reply, list):
+                lineBotApi.reply_message(tk, reply)
+            else:
+                lineBotApi.reply_message(tk, TextSendMessage(reply))
+        incCounter("line_events_total", type=eventType, outcome="replied")
+    except Exception as e:
+        incCounter("line_events_total", type=eventType, outcome="failed")
+        print("Process message fail. Reason: " + str(e))
+
+
+def getEventExecutor():
+    # one pool per process, created after gunicorn forks
+    global _executor, _executorPid
+    with _executorLock:
+        if _executor is None or _executorPid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=lineEventWorkers, thread_name_prefix="line-event"
+            )
+            _executorPid = os.getpid()
+    return _executor
+
+
+def dispatchEvents(lineBotApi, events):
+    # every event in the batch gets its own reply token, so they can run side by side
+    if len(events) <= 1:
+        for event in events:
+            handleEvent(lineBotApi, event)
+        return
+    futures = [getEventExecutor().submit(handleEvent, lineBotApi, event) for event in events]
+    for future in futures:
+        future.result()
+
+
+def resetEventStats():
+    _eventStats.update(
+        enqueued=0, processed=0, overflow=0, busy=0, lastWaitSeconds=0.0, maxWaitSeconds=0.0
+    )
+
+
+def getEventQueue():
+    # the queue and its worker threads are started lazily, once per process after fork
+    global _eventQueue, _eventQueuePid
+    with _eventQueueLock:
+        if _eventQueue is None or _eventQueuePid != os.getpid():
+            _eventQueue = queue.Queue(maxsize=lineEventQueueSize)
+            _eventQueuePid = os.getpid()
+            resetEventStats()
+            for i in range(lineEventWorkers):
+                threading.Thread(
+                    target=drainEvents, args=(_eventQueue,), name=f"line-queue-{i}", daemon=True
+                ).start()
+    return _eventQueue
+
+
+def drainEvents(eventQueue):
+    while True:
+        lineBotApi, event, enqueuedAt = eventQueue.get()
+        wait = time.monotonic() - enqueuedAt
+        observe("line_event_seconds", wait, phase="queue")
+        with _eventQueueLock:
+            _eventStats["busy"] += 1
+            _eventStats["lastWaitSeconds"] = wait
+            _eventStats["maxWaitSeconds"] = max(_eventStats["maxWaitSeconds"], wait)
+        try:
+            handleEvent(lineBotApi, event)
+        finally:
+            with _eventQueueLock:
+                _eventStats["busy"] -= 1
+                _eventStats["processed"] += 1
+            eventQueue.task_done()
+
+
+def enqueueEvents(lineBotApi, events):
+    eventQueue = getEventQueue()
+    for event in events:
+        try:
+            eventQueue.put_nowait((lineBotApi, event, time.monotonic()))
+            with _eventQueueLock:
+                _eventStats["enqueued"] += 1
+        except queue.Full:
+            # backpressure: a full queue slows this request down instead of dropping the punch
+            with _eventQueueLock:
+                _eventStats["overflow"] += 1
+            handleEvent(lineBotApi, event)
+
+
+def eventQueueStats():
+    eventQueue = getEventQueue()
+    with _eventQueueLock:
+        stats = dict(_eventStats)
+    stats.update(
+        mode=lineWebhookMode,
+        workers=lineEventWorkers,
+        depth=eventQueue.qsize(),
+        capacity=lineEventQueueSize,
+        utilisation=eventQueue.qsize() / lineEventQueueSize,
+    )
+    return stats
+
+
+def acceptEvents(lineBotApi, events):
+    # retries of events this worker already handled stop here, before any queue or DB work
+    events = [event for event in events if not isRecentEvent(getEventId(event))]
+    if lineWebhookMode == "queue":
+        enqueueEvents(lineBotApi, events)
+    else:
+        dispatchEvents(lineBotApi, events)
@@ -0,0 +1,159 @@
+import os
+import threading
+import time
+
+from pymongo import MongoClient
+from pymongo.monitoring import ConnectionPoolListener
+from pymongo.server_api import ServerApi
+
+mongoToken = os.getenv("MONGO_TOKEN", "yared612")
+# "mongomock://" swaps in an in-memory stand-in for tests (needs the mongomock package)
+mongoUri = os.getenv(
+    "MONGO_URI",
+    "mongodb+srv://yared:" + mongoToken + "@linetestcluster.qcd8g79.mongodb.net/?retryWrites=true&w=majority&appName=lineTestCluster",
+)
+mongoServerApi = os.getenv("MONGO_SERVER_API", "1")
+mongoMaxPoolSize = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+mongoMinPoolSize = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+mongoMaxIdleTimeMs = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+mongoConnectTimeoutMs = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+mongoServerSelectionTimeoutMs = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+mongoSocketTimeoutMs = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "0")) or None
+mongoWaitQueueTimeoutMs = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "0")) or None
+mongoWriteConcern = os.getenv("MONGO_WRITE_CONCERN", "majority")
+mongoJournal = os.getenv("MONGO_JOURNAL", "true").lower() == "true"
+mongoReadConcern = os.getenv("MONGO_READ_CONCERN", "local")
+mongoReadPreference = os.getenv("MONGO_READ_PREFERENCE", "primary")
+
+_client = None
+_clientPid = None
+_clientLock = threading.Lock()
+
+
+class PoolStats(ConnectionPoolListener):
+    # pymongo has no public pool counters, so they are kept from the pool events
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.counts = {
+            "created": 0,
+            "closed": 0,
+            "checkedOut": 0,
+            "checkedIn": 0,
+            "checkOutFailed": 0,
+            "poolCleared": 0,
+        }
+
+    def bump(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def snapshot(self):
+        with self.lock:
+            counts = dict(self.counts)
+        counts["open"] = counts["created"] - counts["closed"]
+        counts["inUse"] = counts["checkedOut"] - counts["checkedIn"]
+        return counts
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self.bump("poolCleared")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.bump("created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.bump("closed")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self.bump("checkOutFailed")
+
+    def connection_checked_out(self, event):
+        self.bump("checkedOut")
+
+    def connection_checked_in(self, event):
+        self.bump("checkedIn")
+
+
+poolStats = PoolStats()
+
+
+def createClient():
+    if mongoUri.startswith("mongomock://"):
+        import mongomock
+
+        return mongomock.MongoClient()
+
+    poolStats.reset()
+    writeConcern = mongoWriteConcern if not mongoWriteConcern.isdigit() else int(mongoWriteConcern)
+    return MongoClient(
+        mongoUri,
+        server_api=ServerApi(mongoServerApi) if mongoServerApi else None,
+        maxPoolSize=mongoMaxPoolSize,
+        minPoolSize=mongoMinPoolSize,
+        maxIdleTimeMS=mongoMaxIdleTimeMs,
+        connectTimeoutMS=mongoConnectTimeoutMs,
+        serverSelectionTimeoutMS=mongoServerSelectionTimeoutMs,
+        socketTimeoutMS=mongoSocketTimeoutMs,
+        waitQueueTimeoutMS=mongoWaitQueueTimeoutMs,
+        w=writeConcern,
+        journal=mongoJournal,
+        readConcernLevel=mongoReadConcern,
+        readPreference=mongoReadPreference,
+        event_listeners=[poolStats],
+        # sockets are opened by the first operation, not here
+        connect=False,
+    )
+
+
+def getClient():
+    # one client per process, created on first use after gunicorn forks
+    global _client, _clientPid
+    if _client is not None and _clientPid == os.getpid():
+        return _client
+    with _clientLock:
+        if _client is None or _clientPid != os.getpid():
+            _client = createClient()
+            _clientPid = os.getpid()
+    return _client
+
+
+def mongoHealth():
+    start = time.perf_counter()
+    try:
+        getClient().admin.command("ping")
+        status = "ok"
+        error = None
+    except Exception as e:
+        status = "error"
+        error = str(e)
+    return {
+        "status": status,
+        "error": error,
+        "latencyMs": round((time.perf_counter() - start) * 1000, 2),
+        "pid": os.getpid(),
+        "pool": poolStats.snapshot(),
+        "config": {
+            "maxPoolSize": mongoMaxPoolSize,
+            "minPoolSize": mongoMinPoolSize,
+            "writeConcern": mongoWriteConcern,
+            "readConcern": mongoReadConcern,
+            "readPreference": mongoReadPreference,
+        },
+    }
@@ -1,16 +1,73 @@
+import atexit
 import os
 import re
 import json
-from pymongo.mongo_client import MongoClient
-from pymongo.server_api import ServerApi
-from utils.time import getCurrentTime, getCurrentMonth
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+from handler.mongoClient import getClient
+from utils.metrics import timed
+from utils.time import formatTime, getMonthKey, getNow
 from linebot.models import TextSendMessage, StickerSendMessage
 
-mongoToken = 'yared612' # local端需替換成token
-mongoUri = "mongodb+srv://yared:" + mongoToken + "@linetestcluster.qcd8g79.mongodb.net/?retryWrites=true&w=majority&appName=lineTestCluster"
-client = MongoClient(mongoUri, server_api=ServerApi('1'))
+webhookEventTtl = int(os.getenv("LINE_EVENT_DEDUP_TTL", "86400"))
+# punches per (userId, month) bucket document before a new bucket is started
+attendanceBucketSize = int(os.getenv("ATTENDANCE_BUCKET_SIZE", "500"))
+userProfileCacheSize = int(os.getenv("USER_PROFILE_CACHE_SIZE", "1024"))
+# the cache is per process: a re-registration clears it only in the worker that handled it,
+# so the other workers may punch with the old profile for up to this many seconds, which is
+# the accepted staleness; checking Mongo on every punch would cost the round trip the cache
+# saves. 0 turns the cache off
+userProfileCacheTtl = int(os.getenv("USER_PROFILE_CACHE_TTL", "300"))
+# write-behind: ack the punch at once and write punches in batches of up to attendanceFlushSize
+attendanceWriteBehind = os.getenv("ATTENDANCE_WRITE_BEHIND", "false").lower() == "true"
+attendanceFlushSize = int(os.getenv("ATTENDANCE_FLUSH_SIZE", "100"))
+# longest a punch waits in memory before it is written, i.e. the most a hard crash can lose
+attendanceMaxLossMs = int(os.getenv("ATTENDANCE_MAX_LOSS_MS", "50"))
+attendanceSpoolPath = os.getenv(
+    "ATTENDANCE_SPOOL_PATH", os.path.join(tempfile.gettempdir(), "attendance_spool.jsonl")
+)
 
-def insertCompanyUser(jsonData, message):
+userProfileCache = OrderedDict()
+userProfileCacheLock = threading.Lock()
+pendingPunches = []
+pendingPunchesCondition = threading.Condition()
+punchFlushLock = threading.Lock()
+punchFlusherLock = threading.Lock()
+punchFlusherPid = None
+
+def ensureIndexes():
+    # run once at startup so the hot paths never pay for index checks
+    try:
+        getClient()["companyUser"]["test"].create_index("userId")
+        getClient()["work"]["attendanceMonthly"].create_index([("userId", 1), ("month", 1), ("count", 1)])
+        # month-wide reports filter on month (and company) without a userId
+        getClient()["work"]["attendanceMonthly"].create_index([("month", 1), ("companyName", 1)])
+        # Mongo drops webhook claims on its own once they are older than the redelivery window
+        getClient()["line"]["webhookEvents"].create_index("createdAt", expireAfterSeconds=webhookEventTtl)
+    except PyMongoError as e:
+        print("Create mongo index fail. Reason: " + str(e))
+
+@timed("mongo_operation_seconds", operation="claimWebhookEvent")
+def claimWebhookEvent(eventId):
+    # True the first time an event id is seen, False for a LINE redelivery of it
+    collection = getClient()["line"]["webhookEvents"]
+    try:
+        collection.insert_one({"_id": eventId, "createdAt": datetime.now(timezone.utc)})
+        return True
+    except DuplicateKeyError:
+        return False
+    except PyMongoError as e:
+        # without the claim store we would rather risk a duplicate punch than lose one
+        print("Claim webhook event fail. Reason: " + str(e))
+        return True
+
+@timed("mongo_operation_seconds", operation="insertCompanyUser")
+def insertCompanyUser(event, message):
     try:
         # User Data
         userFileList = re.split(r"\s+", message)
@@ -18,23 +75,24 @@ def insertCompanyUser(jsonData, message):
         userName = userFileList[1]
         employeeId = userFileList[2]
         birthday = userFileList[3]
-        createTime = getCurrentTime()
+        createTime = getNow(companyName)
 
         # DB collection
-        dataBase = client["companyUser"]
+        dataBase = getClient()["companyUser"]
         collection = dataBase["test"]
         
         document = {
-            "userId": jsonData["events"][0]["source"]["userId"],
+            "userId": event["source"]["userId"],
             "companyName": companyName,
             "userName": userName,
             "employeeId": employeeId,
             "birthday": birthday,
             "createTime": createTime
         }
-        print("insertCompanyUser mongo request: " + json.dumps(document))
+        print("insertCompanyUser mongo request: " + json.dumps(document, default=str))
         result = collection.insert_one(document) # 插入資料
-        replyMsg = f"建檔成功$\n公司名稱：{companyName}\n姓名：{userName}\n工號：{employeeId}\n建檔時間：{createTime}"
+        invalidateUserProfile(document["userId"])
+        replyMsg = f"建檔成功$\n公司名稱：{companyName}\n姓名：{userName}\n工號：{employeeId}\n建檔時間：{formatTime(createTime, companyName)}"
         print("replyMsg: " + replyMsg)
         emoji = [
             {
@@ -52,19 +110,17 @@ def insertCompanyUser(jsonData, message):
                 "emojiId": "005"
             }
         ]
-        print("Crate user file fail. Reason: " + e)
+        print("Crate user file fail. Reason: " + str(e))
         return [TextSendMessage("建檔失敗$ 請檢查相關輸入是否有誤", emojis=emoji), StickerSendMessage(sticker_id="10551379", package_id="6136")]
 
 
-def insertWorkAttendance(jsonData):
+@timed("mongo_operation_seconds", operation="insertWorkAttendance")
+def insertWorkAttendance(event):
     try:
-        userId = jsonData["events"][0]["source"]["userId"]
+        userId = event["source"]["userId"]
 
         # Check User Data
-        userDataBase = client["companyUser"]
-        userCollection = userDataBase["test"]
-        query = {"userId": userId}
-        queryUserDataResult = userCollection.find_one(query)
+        queryUserDataResult = getUserProfile(userId)
         if queryUserDataResult == None:
             emoji = [
                 {
@@ -80,25 +136,12 @@ def insertWorkAttendance(jsonData):
         employeeId = queryUserDataResult["employeeId"]
 
         # Insert or Update Attendance Data
-        attendanceDataBase = client["work"]
-        attendanceCollection = attendanceDataBase["attendance"]
-        queryAttendanceDataResult = attendanceCollection.find_one(query)
-        createTime = getCurrentTime()
-        if queryAttendanceDataResult == None:
-            print("No data in attendance collection. Insert New Data.")
-            document = {
-                "userId": userId,
-                "companyName": companyName,
-                "userName": userName,
-                "employeeId": employeeId,
-                "attendanceList": [createTime]
-            }
-            print("insertWorkAttendance mongo request: " + json.dumps(document))
-            result = attendanceCollection.insert_one(document) # 插入資料
+        punchTime = getNow(companyName)
+        createTime = formatTime(punchTime, companyName)
+        if attendanceWriteBehind:
+            bufferPunch(userId, companyName, userName, employeeId, punchTime)
         else:
-            updateOperation = {"$push": {"attendanceList": createTime}}
-            print("insertWorkAttendance mongo request: " + json.dumps(updateOperation))
-            attendanceCollection.update_one(query, updateOperation)
+            upsertAttendance(userId, companyName, userName, employeeId, punchTime)
 
         replyMsg = f"打卡成功!!$\n公司名稱：{companyName}\n姓名：{userName}\n工號：{employeeId}\n打卡時間：{createTime}"
         print("replyMsg: " + replyMsg)
@@ -119,4 +162,194 @@ def insertWorkAttendance(jsonData):
             }
         ]
         print("Crate attendence fail. Reason: " + str(e))
-        return [TextSendMessage("打卡失敗$ 請稍後嘗試~~"), StickerSendMessage(sticker_id="10551379", package_id="6136")]
\ No newline at end of file
+        return [TextSendMessage("打卡失敗$ 請稍後嘗試~~"), StickerSendMessage(sticker_id="10551379", package_id="6136")]
+
+
+def getUserProfile(userId):
+    # profiles barely change, so a punch only reads companyUser when the cached copy is stale
+    now = time.monotonic()
+    with userProfileCacheLock:
+        cached = userProfileCache.get(userId)
+        if cached is not None and now - cached[0] < userProfileCacheTtl:
+            userProfileCache.move_to_end(userId)
+            return cached[1]
+
+    projection = {"_id": 0, "companyName": 1, "userName": 1, "employeeId": 1}
+    profile = getClient()["companyUser"]["test"].find_one({"userId": userId}, projection)
+    if profile is None:
+        # not registered yet, they may register any moment so this is not cached
+        return None
+    with userProfileCacheLock:
+        userProfileCache[userId] = (now, profile)
+        userProfileCache.move_to_end(userId)
+        while len(userProfileCache) > userProfileCacheSize:
+            userProfileCache.popitem(last=False)
+    return profile
+
+
+def invalidateUserProfile(userId):
+    # this process only, see userProfileCacheTtl
+    with userProfileCacheLock:
+        userProfileCache.pop(userId, None)
+
+
+def getAttendanceCollection():
+    return getClient()["work"]["attendanceMonthly"]
+
+
+def upsertAttendance(userId, companyName, userName, employeeId, punchTime):
+    # one round trip: push onto this month's bucket that still has room, or create one
+    bucketQuery = {
+        "userId": userId,
+        "month": getMonthKey(punchTime, companyName),
+        "count": {"$lt": attendanceBucketSize}
+    }
+    updateOperation = {
+        "$push": {"punches": punchTime},
+        "$inc": {"count": 1},
+        "$setOnInsert": {
+            "companyName": companyName,
+            "userName": userName,
+            "employeeId": employeeId
+        }
+    }
+    print("insertWorkAttendance mongo request: " + json.dumps(updateOperation, default=str))
+    return getAttendanceCollection().update_one(bucketQuery, updateOperation, upsert=True)
+
+
+def bufferPunch(userId, companyName, userName, employeeId, punchTime):
+    startPunchFlusher()
+    with pendingPunchesCondition:
+        pendingPunches.append((userId, companyName, userName, employeeId, punchTime))
+        if len(pendingPunches) >= attendanceFlushSize:
+            pendingPunchesCondition.notify()
+
+
+def startPunchFlusher():
+    # one flusher thread per process, started lazily after gunicorn forks; the pid is checked
+    # before any lock, so a punch never waits behind a flush in progress
+    global punchFlusherPid
+    if punchFlusherPid == os.getpid():
+        return
+    with punchFlusherLock:
+        if punchFlusherPid == os.getpid():
+            return
+        punchFlusherPid = os.getpid()
+    replayPunchSpool()
+    threading.Thread(target=runPunchFlusher, name="punch-flusher", daemon=True).start()
+
+
+def runPunchFlusher():
+    backoff = 0
+    while True:
+        if backoff:
+            # Mongo is failing, the punches stay buffered until it comes back
+            time.sleep(backoff)
+        with pendingPunchesCondition:
+            pendingPunchesCondition.wait_for(
+                lambda: len(pendingPunches) >= attendanceFlushSize,
+                timeout=attendanceMaxLossMs / 1000
+            )
+        failed = flushPunches()
+        backoff = min(max(backoff * 2, attendanceMaxLossMs / 1000), 5) if failed else 0
+
+
+def buildPunchOperations(punches):
+    # punches of the same bucket are merged, so a burst from one user is a single update
+    groups = {}
+    for userId, companyName, userName, employeeId, punchTime in punches:
+        key = (userId, getMonthKey(punchTime, companyName))
+        groups.setdefault(key, {"profile": (companyName, userName, employeeId), "punches": []})
+        groups[key]["punches"].append(punchTime)
+
+    operations, groupPunches = [], []
+    for (userId, month), group in groups.items():
+        companyName, userName, employeeId = group["profile"]
+        operations.append(UpdateOne(
+            {"userId": userId, "month": month, "count": {"$lt": attendanceBucketSize}},
+            {
+                "$push": {"punches": {"$each": group["punches"]}},
+                "$inc": {"count": len(group["punches"])},
+                "$setOnInsert": {
+                    "companyName": companyName,
+                    "userName": userName,
+                    "employeeId": employeeId
+                }
+            },
+            upsert=True
+        ))
+        groupPunches.append([
+            (userId, companyName, userName, employeeId, punchTime)
+            for punchTime in group["punches"]
+        ])
+    return operations, groupPunches
+
+
+@timed("mongo_operation_seconds", operation="flushPunches")
+def flushPunches():
+    # one unordered bulk_write per flush; whatever fails goes back to the front of the buffer
+    # and the number of failed punches is returned. punchFlushLock only serialises flushes
+    with punchFlushLock:
+        with pendingPunchesCondition:
+            punches = pendingPunches[:]
+            del pendingPunches[:]
+        if not punches:
+            return 0
+
+        operations, groupPunches = buildPunchOperations(punches)
+        failed = []
+        try:
+            getAttendanceCollection().bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            print("Flush attendance fail. Reason: " + str(e.details.get("writeErrors")))
+            for error in e.details.get("writeErrors", []):
+                failed += groupPunches[error["index"]]
+        except PyMongoError as e:
+            print("Flush attendance fail. Reason: " + str(e))
+            failed = punches
+
+        if failed:
+            with pendingPunchesCondition:
+                pendingPunches[:0] = failed
+        return len(failed)
+
+
+def spoolPunches():
+    # last resort on shutdown: keep what Mongo did not take in a local file for the next start
+    with pendingPunchesCondition:
+        punches = pendingPunches[:]
+        del pendingPunches[:]
+    if not punches:
+        return
+    with open(attendanceSpoolPath, "a", encoding="utf-8") as f:
+        for userId, companyName, userName, employeeId, punchTime in punches:
+            record = [userId, companyName, userName, employeeId, punchTime.isoformat()]
+            f.write(json.dumps(record) + "\n")
+    print(f"Spooled {len(punches)} attendance punches to {attendanceSpoolPath}")
+
+
+def replayPunchSpool():
+    # the rename makes sure only one worker picks up a given spool file
+    claimedPath = f"{attendanceSpoolPath}.{os.getpid()}"
+    try:
+        os.replace(attendanceSpoolPath, claimedPath)
+    except FileNotFoundError:
+        return
+    with open(claimedPath, encoding="utf-8") as f:
+        punches = [json.loads(line) for line in f if line.strip()]
+    with pendingPunchesCondition:
+        for userId, companyName, userName, employeeId, punchTime in punches:
+            pendingPunches.append(
+                (userId, companyName, userName, employeeId, datetime.fromisoformat(punchTime))
+            )
+    os.remove(claimedPath)
+    print(f"Replayed {len(punches)} spooled attendance punches")
+
+
+@atexit.register
+def shutdownPunchFlusher():
+    # flushPunches waits for a flush already in flight, so nothing is between the two lists here
+    try:
+        flushPunches()
+    finally:
+        spoolPunches()
@@ -0,0 +1,158 @@
+import csv
+import io
+import json
+import os
+from datetime import datetime, timedelta
+
+from handler.mongoClient import getClient
+from utils.time import getTimezone, getTimezoneName, toLocal
+
+# when each auto-calendar shift starts, in local time, for the lateness column
+shiftStartTimes = json.loads(
+    os.getenv("ATTENDANCE_SHIFT_STARTS", '{"day": "08:00", "swing": "16:00", "night": "00:00"}')
+)
+reportBatchSize = int(os.getenv("ATTENDANCE_REPORT_BATCH_SIZE", "1000"))
+
+reportColumns = [
+    "userId",
+    "employeeId",
+    "userName",
+    "companyName",
+    "date",
+    "firstIn",
+    "lastOut",
+    "punches",
+    "hoursWorked",
+    "shift",
+    "lateMinutes",
+]
+
+
+def getMonthRange(start, end):
+    # bucket months touched by [start, end), so the first $match can use the month index
+    months = []
+    current = start.replace(day=1)
+    while current < end:
+        months.append(current.strftime("%Y-%m"))
+        current = (current + timedelta(days=32)).replace(day=1)
+    return months
+
+
+def buildAttendancePipeline(start, end, companyName=None, userIds=None):
+    bucketMatch = {"month": {"$in": getMonthRange(start, end)}}
+    if companyName:
+        bucketMatch["companyName"] = companyName
+    if userIds:
+        bucketMatch["userId"] = {"$in": userIds}
+    return [
+        {"$match": bucketMatch},
+        {"$unwind": "$punches"},
+        {"$match": {"punches": {"$gte": start, "$lt": end}}},
+        {
+            "$group": {
+                "_id": {
+                    "userId": "$userId",
+                    "date": {
+                        "$dateToString": {
+                            "format": "%Y-%m-%d",
+                            "date": "$punches",
+                            "timezone": getTimezoneName(getTimezone(companyName)),
+                        }
+                    },
+                },
+                "employeeId": {"$first": "$employeeId"},
+                "userName": {"$first": "$userName"},
+                "companyName": {"$first": "$companyName"},
+                "firstIn": {"$min": "$punches"},
+                "lastOut": {"$max": "$punches"},
+                "punches": {"$sum": 1},
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "userId": "$_id.userId",
+                "date": "$_id.date",
+                "employeeId": 1,
+                "userName": 1,
+                "companyName": 1,
+                "firstIn": 1,
+                "lastOut": 1,
+                "punches": 1,
+                "hoursWorked": {
+                    "$round": [{"$divide": [{"$subtract": ["$lastOut", "$firstIn"]}, 3600000]}, 2]
+                },
+            }
+        },
+        {"$sort": {"userId": 1, "date": 1}},
+    ]
+
+
+def buildShiftLookup(schedule, month):
+    # {"Day 3": {"day": ["A", ...]}} -> {("2024-09-03", "A"): "day"}
+    lookup = {}
+    for dayLabel, shifts in schedule.items():
+        date = f"{month}-{int(dayLabel.split()[-1]):02d}"
+        for shift, names in shifts.items():
+            for name in names:
+                lookup[(date, name)] = shift
+    return lookup
+
+
+def getLateMinutes(row, shift, startTimes):
+    if shift not in startTimes:
+        return None
+    hour, minute = (int(part) for part in startTimes[shift].split(":"))
+    shiftStart = datetime.strptime(row["date"], "%Y-%m-%d").replace(
+        hour=hour, minute=minute, tzinfo=row["firstIn"].tzinfo
+    )
+    late = (row["firstIn"] - shiftStart).total_seconds() / 60
+    return round(max(late, 0), 1)
+
+
+def iterAttendanceReport(
+    start, end, companyName=None, userIds=None, schedule=None, month=None, startTimes=None
+):
+    # rows come out of the aggregation cursor one batch at a time, never the whole month at once
+    startTimes = startTimes or shiftStartTimes
+    lookup = buildShiftLookup(schedule, month) if schedule and month else {}
+    cursor = getClient()["work"]["attendanceMonthly"].aggregate(
+        buildAttendancePipeline(start, end, companyName, userIds),
+        allowDiskUse=True,
+        batchSize=reportBatchSize,
+    )
+    for row in cursor:
+        for field in ("firstIn", "lastOut"):
+            row[field] = toLocal(row[field], row.get("companyName"))
+        shift = lookup.get((row["date"], row.get("userName"))) or lookup.get(
+            (row["date"], row.get("employeeId"))
+        )
+        row["shift"] = shift
+        row["lateMinutes"] = getLateMinutes(row, shift, startTimes) if shift else None
+        yield row
+
+
+def formatReportRow(row):
+    formatted = {column: row.get(column) for column in reportColumns}
+    for column in ("firstIn", "lastOut"):
+        formatted[column] = formatted[column].isoformat()
+    return formatted
+
+
+def streamCsv(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=reportColumns)
+    writer.writeheader()
+    for count, row in enumerate(rows, 1):
+        writer.writerow(formatReportRow(row))
+        # hand the web server a chunk every few hundred rows instead of one per row
+        if count % 200 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def streamNdjson(rows):
+    for row in rows:
+        yield json.dumps(formatReportRow(row), ensure_ascii=False) + "\n"
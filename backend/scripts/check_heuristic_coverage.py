@@ -0,0 +1,54 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.heuristic_scheduler import solve_heuristic
+
+
+def employee(level, shift, shifts=None):
+    record = {"level": level, "shift": shift, "off_days": [], "preferred_off_days": []}
+    if shifts:
+        record["shifts"] = shifts
+    return record
+
+
+# rosters the heuristic cannot staff; an understaffed schedule must never come back Feasible
+CASES = {
+    "pool smaller than the requirement": (
+        {"A": employee("senior", "day"), "B": employee("junior", "day")},
+        {"day": [3] * 7},
+    ),
+    "multi-shift employee already on another shift": (
+        {
+            "A": employee("senior", "day", ["day", "night"]),
+            "B": employee("senior", "night"),
+        },
+        {"day": [1] * 7, "night": [2] * 7},
+    ),
+}
+
+
+def checkCase(employees, shiftRequirements):
+    scheduleResult, stats = solve_heuristic(
+        employees, shiftRequirements, 7, options={"time_limit": 1}, max_iterations=2000
+    )
+    shortfall = sum(
+        max(required - len(scheduleResult[f"Day {day + 1}"][shift]), 0)
+        for shift, days in shiftRequirements.items()
+        for day, required in enumerate(days)
+    )
+    return stats, shortfall
+
+
+if __name__ == "__main__":
+    failed = False
+    for name, (employees, shiftRequirements) in CASES.items():
+        stats, shortfall = checkCase(employees, shiftRequirements)
+        ok = shortfall > 0 and stats["status"] == "Infeasible" and stats["hard_violations"] > 0
+        failed |= not ok
+        print(
+            f"{'ok' if ok else 'FAIL':>4}  {name}: status={stats['status']} "
+            f"hard_violations={stats['hard_violations']} shortfall={shortfall}"
+        )
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,81 @@
+import argparse
+import os
+import subprocess
+import sys
+
+backendDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# what a worker must not pay for at boot; each loads on first use instead
+LAZY_MODULES = ["pulp", "numpy", "flasgger"]
+
+
+def profileImport(module, env):
+    # a fresh interpreter per run, -X importtime writes one line per module to stderr
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=backendDir,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        sys.exit(f"import {module} failed:\n{result.stderr}")
+
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        selfUs, cumulativeUs, name = line[len("import time:") :].split("|")
+        indent = len(name) - len(name.lstrip())
+        timings.append((name.strip(), int(selfUs), int(cumulativeUs), indent))
+    return timings
+
+
+def report(timings, module, top):
+    # children are printed before their parent, one indent level deeper
+    end = max(i for i, timing in enumerate(timings) if timing[0] == module)
+    moduleIndent = timings[end][3]
+    start = end
+    while start > 0 and timings[start - 1][3] > moduleIndent:
+        start -= 1
+    children = [timing for timing in timings[start:end] if timing[3] == moduleIndent + 2]
+
+    total = timings[end][2]
+    print(f"import {module}: {total / 1000:.1f} ms, {end - start + 1} modules")
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    for name, selfUs, cumulativeUs, _ in sorted(children, key=lambda t: -t[2])[:top]:
+        print(f"{cumulativeUs / 1000:>14.1f} {selfUs / 1000:>8.1f}  {name}")
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Profile `import app` with -X importtime and fail when it is over budget."
+    )
+    parser.add_argument("--module", default="app")
+    parser.add_argument(
+        "--budget-ms", type=float, default=float(os.getenv("IMPORT_TIME_BUDGET_MS", "600"))
+    )
+    parser.add_argument("--runs", type=int, default=3, help="the fastest run is compared")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--swagger", action="store_true", help="profile with ENABLE_SWAGGER=true")
+    args = parser.parse_args()
+
+    env = {**os.environ, "ENABLE_SWAGGER": "true" if args.swagger else "false"}
+    runs = [profileImport(args.module, env) for _ in range(args.runs)]
+    fastest = min(
+        runs, key=lambda timings: next(t[2] for t in reversed(timings) if t[0] == args.module)
+    )
+    total = report(fastest, args.module, args.top)
+
+    failures = []
+    if total / 1000 > args.budget_ms:
+        failures.append(f"import {args.module} took {total / 1000:.1f} ms > {args.budget_ms:g} ms")
+    imported = {name for name, _, _, _ in fastest}
+    lazy = LAZY_MODULES if not args.swagger else [m for m in LAZY_MODULES if m != "flasgger"]
+    for name in lazy:
+        if name in imported:
+            failures.append(f"{name} is imported at boot, it should load on first use")
+    for failure in failures:
+        print("FAIL: " + failure)
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,67 @@
+import argparse
+import gzip
+import os
+
+# text assets only, images and fonts are already compressed
+COMPRESSIBLE_EXTENSIONS = (".js", ".css", ".html", ".json", ".map", ".svg", ".txt", ".ico")
+MIN_SIZE = 1024
+
+backendDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+defaultStaticDir = os.path.join(backendDir, "static")
+
+
+def loadBrotli():
+    # needs the Brotli package; without it only .gz variants are written
+    try:
+        import brotli
+    except ImportError:
+        print("Brotli is not installed, skipping .br variants")
+        return None
+    return brotli
+
+
+def writeVariant(path, data, original):
+    # only kept when it saves bytes; a stale variant from an earlier build must not survive
+    if len(data) >= len(original):
+        if os.path.exists(path):
+            os.remove(path)
+        return 0
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+    return len(data)
+
+
+def compressStatic(staticDir, level):
+    brotli = loadBrotli()
+    files, originalBytes, gzipBytes, brotliBytes = 0, 0, 0, 0
+    for root, _, names in os.walk(staticDir):
+        for name in names:
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                data = f.read()
+            if len(data) < MIN_SIZE:
+                continue
+            files += 1
+            originalBytes += len(data)
+
+            # mtime=0 keeps the .gz byte-identical across builds
+            gzipBytes += writeVariant(
+                path + ".gz", gzip.compress(data, compresslevel=level, mtime=0), data
+            )
+            if brotli is not None:
+                brotliBytes += writeVariant(path + ".br", brotli.compress(data, quality=11), data)
+
+    print(f"Compressed {files} assets, {originalBytes} bytes -> gzip {gzipBytes}, br {brotliBytes}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Write .gz and .br variants next to the React build in backend/static."
+    )
+    parser.add_argument("static_dir", nargs="?", default=defaultStaticDir)
+    parser.add_argument("--level", type=int, default=9)
+    args = parser.parse_args()
+    compressStatic(args.static_dir, args.level)
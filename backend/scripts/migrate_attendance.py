@@ -0,0 +1,99 @@
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from handler.mongoHandler import (
+    attendanceBucketSize,
+    ensureIndexes,
+    getAttendanceCollection,
+)
+from handler.mongoClient import getClient
+from pymongo import ReplaceOne
+from utils.time import getMonthKey
+
+# legacy attendanceList entries are "%Y/%m/%d %H:%M:%S" strings in UTC+8
+LEGACY_TIMEZONE = timezone(timedelta(hours=8))
+
+
+def parseLegacyPunch(value):
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    return datetime.strptime(value, "%Y/%m/%d %H:%M:%S").replace(tzinfo=LEGACY_TIMEZONE)
+
+
+def buildBuckets(document):
+    # split one unbounded attendanceList into (userId, month) buckets of at most bucketSize
+    months = {}
+    for value in document.get("attendanceList", []):
+        try:
+            punchTime = parseLegacyPunch(value)
+        except (TypeError, ValueError):
+            print(f"Skip unreadable punch {value!r} of {document['userId']}")
+            continue
+        months.setdefault(getMonthKey(punchTime, document.get("companyName")), []).append(punchTime)
+
+    buckets = []
+    for month, punches in sorted(months.items()):
+        punches.sort()
+        for start in range(0, len(punches), attendanceBucketSize):
+            chunk = punches[start : start + attendanceBucketSize]
+            buckets.append(
+                {
+                    # a fixed _id makes re-running the backfill overwrite instead of duplicate
+                    "_id": f"legacy:{document['userId']}:{month}:{start // attendanceBucketSize}",
+                    "userId": document["userId"],
+                    "month": month,
+                    "companyName": document.get("companyName"),
+                    "userName": document.get("userName"),
+                    "employeeId": document.get("employeeId"),
+                    "punches": chunk,
+                    "count": len(chunk),
+                }
+            )
+    return buckets
+
+
+def flush(source, target, operations, sourceIds):
+    # buckets are written before their source documents are marked, so a crash only repeats work
+    if operations:
+        target.bulk_write(operations, ordered=False)
+    if sourceIds:
+        source.update_many(
+            {"_id": {"$in": sourceIds}}, {"$set": {"migratedAt": datetime.now(timezone.utc)}}
+        )
+
+
+def migrate(batchSize, dryRun):
+    source = getClient()["work"]["attendance"]
+    target = getAttendanceCollection()
+    operations, sourceIds, users, punches = [], [], 0, 0
+    for document in source.find({"migratedAt": {"$exists": False}}):
+        buckets = buildBuckets(document)
+        users += 1
+        punches += sum(bucket["count"] for bucket in buckets)
+        if dryRun:
+            continue
+        operations += [
+            ReplaceOne({"_id": bucket["_id"]}, bucket, upsert=True) for bucket in buckets
+        ]
+        sourceIds.append(document["_id"])
+        if len(operations) >= batchSize:
+            flush(source, target, operations, sourceIds)
+            operations, sourceIds = [], []
+    if not dryRun:
+        flush(source, target, operations, sourceIds)
+    print(f"{'Would migrate' if dryRun else 'Migrated'} {punches} punches of {users} users")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Backfill work.attendanceMonthly from the legacy work.attendance documents."
+    )
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    ensureIndexes()
+    migrate(args.batch_size, args.dry_run)
@@ -1,6 +1,39 @@
+import copy
+import importlib
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import pulp
 
+OBJECTIVE_WEIGHTS = {"preferred_off_day": 1, "five_day_streak": 10, "one_day_streak": 5}
+
+# engine name -> "module:function", every engine returns (get_schedule_result shape, stats)
+SCHEDULE_ENGINES = {
+    "milp": "utils.auto_calendar:solve_milp",
+    "heuristic": "utils.heuristic_scheduler:solve_heuristic",
+}
+# "auto" switches to the heuristic above this many employee-days per block
+HEURISTIC_THRESHOLD = int(os.getenv("AUTO_CALENDAR_HEURISTIC_THRESHOLD", "15000"))
+
+# defaults for every solve, a request may override any of them
+SOLVER_OPTIONS = {
+    "solver": os.getenv("AUTO_CALENDAR_SOLVER", "cbc"),
+    "time_limit": float(os.getenv("AUTO_CALENDAR_TIME_LIMIT", "0")) or None,
+    "gap": float(os.getenv("AUTO_CALENDAR_GAP", "0")) or None,
+    "threads": int(os.getenv("AUTO_CALENDAR_THREADS", "0")) or None,
+    # solver model/solution files go to tmpfs when the host has one
+    "tmp_dir": os.getenv("AUTO_CALENDAR_TMP_DIR")
+    or ("/dev/shm" if os.access("/dev/shm", os.W_OK) else None),
+}
+# worst first, used to summarise the status of several blocks
+SOLVER_STATUS_ORDER = ["Infeasible", "Unbounded", "Undefined", "Not Solved", "Feasible", "Optimal"]
+
 
 def define_employees():
     employees = {
@@ -115,139 +148,258 @@ def define_shift_requirements():
     return shift_requirements
 
 
+def get_num_days(shift_requirements):
+    return len(next(iter(shift_requirements.values())))
+
+
+def get_employee_shifts(employee):
+    # "shifts" lists every shift a multi-shift employee may cover, "shift" is the default one
+    return employee.get("shifts") or [employee["shift"]]
+
+
+def validate_roster(employees, shift_requirements, weights=None):
+    # rosters from request bodies are checked before anything is built from them, so a bad
+    # shape is a ValueError here rather than a KeyError deep inside a solve or a job
+    if not isinstance(shift_requirements, dict) or not shift_requirements:
+        raise ValueError("shift_requirements must be an object of per-day lists")
+    lengths = set()
+    for shift, required in shift_requirements.items():
+        if not isinstance(required, list) or not all(
+            type(count) is int and count >= 0 for count in required
+        ):
+            raise ValueError(f"shift_requirements of {shift} must be a list of counts")
+        lengths.add(len(required))
+    if len(lengths) != 1 or 0 in lengths:
+        raise ValueError("every shift in shift_requirements needs the same number of days")
+
+    if not isinstance(employees, dict):
+        raise ValueError("employees must be an object")
+    for emp, employee in employees.items():
+        if not isinstance(employee, dict):
+            raise ValueError(f"employee {emp} is not an object")
+        for key in ("level", "shift", "off_days", "preferred_off_days"):
+            if key not in employee:
+                raise ValueError(f"employee {emp} has no {key}")
+        for key in ("off_days", "preferred_off_days"):
+            if not isinstance(employee[key], list) or not all(
+                type(day) is int for day in employee[key]
+            ):
+                raise ValueError(f"{key} of employee {emp} must be a list of days")
+        if not isinstance(employee.get("shifts") or [], list):
+            raise ValueError(f"shifts of employee {emp} must be a list")
+        if not any(shift in shift_requirements for shift in get_employee_shifts(employee)):
+            raise ValueError(f"employee {emp} has no shift in shift_requirements")
+
+    if weights is not None:
+        if not isinstance(weights, dict):
+            raise ValueError("weights must be an object")
+        for name in OBJECTIVE_WEIGHTS:
+            if not isinstance(weights.get(name), (int, float)) or isinstance(weights[name], bool):
+                raise ValueError(f"weights needs a number for {name}")
+
+
+def compile_roster(employees, shift_requirements):
+    # Built once per request so constraint generation never rescans the employees dict
+    num_days = get_num_days(shift_requirements)
+    names = list(employees)
+    roster = {
+        "num_days": num_days,
+        "employees": names,
+        "ids": {emp: i for i, emp in enumerate(names)},
+        "shifts": {},
+        "by_shift": {shift: [] for shift in shift_requirements},
+        "by_shift_level": {},
+        "off_days": np.zeros((len(names), num_days), dtype=bool),
+        "preferred_off_days": np.zeros((len(names), num_days), dtype=bool),
+    }
+    for i, emp in enumerate(names):
+        employee = employees[emp]
+        shifts = [shift for shift in get_employee_shifts(employee) if shift in shift_requirements]
+        roster["shifts"][emp] = shifts
+        for shift in shifts:
+            roster["by_shift"][shift].append(emp)
+            roster["by_shift_level"].setdefault((shift, employee["level"]), []).append(emp)
+        # off days are 1-based in the roster data
+        for key in ("off_days", "preferred_off_days"):
+            days = np.asarray(employee[key], dtype=int) - 1
+            roster[key][i, days[(days >= 0) & (days < num_days)]] = True
+    return roster
+
+
 def create_problem():
     prob = pulp.LpProblem("Shift Scheduling", pulp.LpMinimize)
     return prob
 
 
 def define_variables(employees, shift_requirements):
+    # only (emp, day, shift) combinations the employee can actually work get a variable
     schedule = pulp.LpVariable.dicts(
         "schedule",
         [
             (emp, day, shift)
             for emp in employees
-            for day in range(len(shift_requirements["day"]))
-            for shift in shift_requirements
+            for shift in get_employee_shifts(employees[emp])
+            if shift in shift_requirements
+            for day in range(get_num_days(shift_requirements))
         ],
         cat="Binary",
     )
     return schedule
 
 
-def add_constraints(prob, schedule, employees, shift_requirements, max_consecutive_days):
-    num_days = len(shift_requirements["day"])
+def add_row(prob, terms, sense, rhs, name=None):
+    # Builds the row straight from (var, coef) terms, skipping PuLP's operator overloading
+    prob.addConstraint(pulp.LpConstraint(pulp.LpAffineExpression(terms), sense, rhs=rhs), name)
+
+
+def add_constraints(
+    prob, schedule, employees, shift_requirements, max_consecutive_days, roster=None
+):
+    roster = roster or compile_roster(employees, shift_requirements)
+    num_days = roster["num_days"]
     shifts = list(shift_requirements.keys())
+    names = roster["employees"]
+    # slots[emp][day] holds the variables of every shift the employee may work that day
+    slots = {
+        emp: [
+            [schedule[(emp, day, shift)] for shift in roster["shifts"][emp]]
+            for day in range(num_days)
+        ]
+        for emp in names
+    }
 
     # condition1：check all shifts are correct
     for day in range(num_days):
         for shift in shifts:
-            prob += (
-                pulp.lpSum(
-                    [
-                        schedule[(emp, day, shift)]
-                        for emp in employees
-                        if employees[emp]["shift"] == shift
-                    ]
-                )
-                == shift_requirements[shift][day],
+            add_row(
+                prob,
+                [(schedule[(emp, day, shift)], 1) for emp in roster["by_shift"][shift]],
+                pulp.LpConstraintEQ,
+                shift_requirements[shift][day],
                 f"ShiftRequirement_{shift}_Day{day}",
             )
 
+    # condition1-1：multi-shift employees work at most one shift a day
+    for emp in names:
+        if len(roster["shifts"][emp]) > 1:
+            for day in range(num_days):
+                add_row(
+                    prob,
+                    [(var, 1) for var in slots[emp][day]],
+                    pulp.LpConstraintLE,
+                    1,
+                    f"OneShiftPerDay_{emp}_Day{day}",
+                )
+
     # condition2：check all employees work day are correct
-    for emp in employees:
-        shift = employees[emp]["shift"]
+    for emp in names:
         for day in range(num_days - max_consecutive_days):
-            prob += (
-                pulp.lpSum(
-                    [schedule[(emp, day + d, shift)] for d in range(max_consecutive_days + 1)]
-                )
-                <= max_consecutive_days,
+            add_row(
+                prob,
+                [
+                    (var, 1)
+                    for d in range(max_consecutive_days + 1)
+                    for var in slots[emp][day + d]
+                ],
+                pulp.LpConstraintLE,
+                max_consecutive_days,
                 f"MaxConsecutive_{emp}_Day{day}",
             )
 
     # condition3：employees off days
-    for emp in employees:
-        for off_day in employees[emp]["off_days"]:
-            if off_day - 1 in range(num_days):
-                shift = employees[emp]["shift"]
-                prob += schedule[(emp, off_day - 1, shift)] == 0, f"OffDay_{emp}_Day{off_day}"
+    for i, day in np.argwhere(roster["off_days"]).tolist():
+        emp = names[i]
+        add_row(
+            prob,
+            [(var, 1) for var in slots[emp][day]],
+            pulp.LpConstraintEQ,
+            0,
+            f"OffDay_{emp}_Day{day + 1}",
+        )
 
     # condition4：Must have one senior employee in each shift
     for day in range(num_days):
         for shift in shifts:
-            prob += (
-                pulp.lpSum(
-                    [
-                        schedule[(emp, day, shift)]
-                        for emp in employees
-                        if employees[emp]["level"] == "senior" and employees[emp]["shift"] == shift
-                    ]
-                )
-                >= 1,
+            add_row(
+                prob,
+                [
+                    (schedule[(emp, day, shift)], 1)
+                    for emp in roster["by_shift_level"].get((shift, "senior"), [])
+                ],
+                pulp.LpConstraintGE,
+                1,
                 f"Senior_{shift}_Day{day}",
             )
 
     # add var
     is_five_day_streak = pulp.LpVariable.dicts(
         "is_five_day_streak",
-        [(emp, day) for emp in employees for day in range(num_days - 4)],
+        [(emp, day) for emp in names for day in range(num_days - 4)],
         cat="Binary",
     )
 
     is_one_day_streak = pulp.LpVariable.dicts(
         "is_one_day_streak",
-        [(emp, day) for emp in employees for day in range(num_days)],
+        [(emp, day) for emp in names for day in range(num_days)],
         cat="Binary",
     )
 
     # condition5：Define five day streak and one day streak
-    for emp in employees:
-        shift = employees[emp]["shift"]
+    for emp in names:
         for day in range(num_days - 4):
+            streak = is_five_day_streak[(emp, day)]
             # If an employee work 5 consecutive days, is_five_day_streak = 1
-            prob += is_five_day_streak[(emp, day)] <= schedule[(emp, day, shift)]
-            prob += is_five_day_streak[(emp, day)] <= schedule[(emp, day + 1, shift)]
-            prob += is_five_day_streak[(emp, day)] <= schedule[(emp, day + 2, shift)]
-            prob += is_five_day_streak[(emp, day)] <= schedule[(emp, day + 3, shift)]
-            prob += is_five_day_streak[(emp, day)] <= schedule[(emp, day + 4, shift)]
-            prob += (
-                is_five_day_streak[(emp, day)]
-                >= schedule[(emp, day, shift)]
-                + schedule[(emp, day + 1, shift)]
-                + schedule[(emp, day + 2, shift)]
-                + schedule[(emp, day + 3, shift)]
-                + schedule[(emp, day + 4, shift)]
-                - 4,
+            for d in range(5):
+                add_row(
+                    prob,
+                    [(streak, 1)] + [(var, -1) for var in slots[emp][day + d]],
+                    pulp.LpConstraintLE,
+                    0,
+                )
+            add_row(
+                prob,
+                [(streak, 1)] + [(var, -1) for d in range(5) for var in slots[emp][day + d]],
+                pulp.LpConstraintGE,
+                -4,
                 f"FiveDayStreak_{emp}_Day{day}",
             )
 
     # condition6：Define only work 1 day streak
-    for emp in employees:
-        shift = employees[emp]["shift"]
+    for emp in names:
         for day in range(num_days):
-            if day == 0:
-                prev_day_off = 1
-            else:
-                prev_day_off = 1 - schedule[(emp, day - 1, shift)]
-            if day == num_days - 1:
-                next_day_off = 1
-            else:
-                next_day_off = 1 - schedule[(emp, day + 1, shift)]
-            prob += (
-                is_one_day_streak[(emp, day)]
-                >= schedule[(emp, day, shift)] - (1 - prev_day_off) - (1 - next_day_off),
+            streak = is_one_day_streak[(emp, day)]
+            today = slots[emp][day]
+            # previous / next day worked, empty on the month boundaries
+            prev_day = slots[emp][day - 1] if day > 0 else []
+            next_day = slots[emp][day + 1] if day < num_days - 1 else []
+            add_row(
+                prob,
+                [(streak, 1)]
+                + [(var, -1) for var in today]
+                + [(var, 1) for var in prev_day + next_day],
+                pulp.LpConstraintGE,
+                0,
                 f"OneDayStreakDef1_{emp}_Day{day}",
             )
-            prob += (
-                is_one_day_streak[(emp, day)] <= schedule[(emp, day, shift)],
+            add_row(
+                prob,
+                [(streak, 1)] + [(var, -1) for var in today],
+                pulp.LpConstraintLE,
+                0,
                 f"OneDayStreakDef2_{emp}_Day{day}",
             )
-            prob += (
-                is_one_day_streak[(emp, day)] <= prev_day_off,
+            add_row(
+                prob,
+                [(streak, 1)] + [(var, 1) for var in prev_day],
+                pulp.LpConstraintLE,
+                1,
                 f"OneDayStreakDef3_{emp}_Day{day}",
             )
-            prob += (
-                is_one_day_streak[(emp, day)] <= next_day_off,
+            add_row(
+                prob,
+                [(streak, 1)] + [(var, 1) for var in next_day],
+                pulp.LpConstraintLE,
+                1,
                 f"OneDayStreakDef4_{emp}_Day{day}",
             )
 
@@ -255,52 +407,538 @@ def add_constraints(prob, schedule, employees, shift_requirements, max_consecuti
 
 
 def add_objective_function(
-    prob, schedule, employees, shift_requirements, is_five_day_streak, is_one_day_streak
+    prob,
+    schedule,
+    employees,
+    shift_requirements,
+    is_five_day_streak,
+    is_one_day_streak,
+    roster=None,
+    weights=None,
 ):
+    roster = roster or compile_roster(employees, shift_requirements)
+    weights = weights or OBJECTIVE_WEIGHTS
+    names = roster["employees"]
+
+    preferred_off_days = np.argwhere(roster["preferred_off_days"]).tolist()
+
     # Original objective function： Maximize the employees' expected off days
-    prob += (
-        pulp.lpSum(
-            [
-                (1 - schedule[(emp, day - 1, employees[emp]["shift"])])
-                for emp in employees
-                for day in employees[emp]["preferred_off_days"]
-                if day - 1 in range(len(shift_requirements["day"]))
-            ]
-        )
+    prob += pulp.LpAffineExpression(
+        [
+            (schedule[(names[i], day, shift)], -weights["preferred_off_day"])
+            for i, day in preferred_off_days
+            for shift in roster["shifts"][names[i]]
+        ]
         # Add Minimize the employees' expected off days
-        + pulp.lpSum(
-            [
-                is_five_day_streak[(emp, day)] * 10
-                for emp in employees
-                for day in range(len(shift_requirements["day"]) - 4)
-            ]
-        )
-        + pulp.lpSum(
-            [
-                is_one_day_streak[(emp, day)] * 5
-                for emp in employees
-                for day in range(len(shift_requirements["day"]))
-            ]
+        + [(var, weights["five_day_streak"]) for var in is_five_day_streak.values()]
+        + [(var, weights["one_day_streak"]) for var in is_one_day_streak.values()],
+        constant=len(preferred_off_days) * weights["preferred_off_day"],
+    )
+
+
+def get_solver_options(overrides=None):
+    options = dict(SOLVER_OPTIONS)
+    options.update({key: value for key, value in (overrides or {}).items() if value is not None})
+    return options
+
+
+def is_solver_available(name):
+    if name == "highs":
+        return hasattr(pulp, "HiGHS") and pulp.HiGHS(msg=False).available()
+    return name == "cbc"
+
+
+def get_solver(options, warm_start=False, log_path=None):
+    if options["solver"] == "highs":
+        solver = pulp.HiGHS(
+            msg=False,
+            timeLimit=options["time_limit"],
+            gapRel=options["gap"],
+            threads=options["threads"],
         )
+        if not solver.available():
+            raise ValueError("HiGHS solver is not installed")
+        return solver
+    if options["solver"] != "cbc":
+        raise ValueError(f"Unknown solver: {options['solver']}")
+
+    # CBC starts from the initial values set on the variables when warm starting
+    solver = pulp.PULP_CBC_CMD(
+        msg=False,
+        timeLimit=options["time_limit"],
+        gapRel=options["gap"],
+        threads=options["threads"],
+        warmStart=warm_start,
+        logPath=log_path,
     )
+    if options["tmp_dir"]:
+        solver.tmpDir = options["tmp_dir"]
+    return solver
+
+
+def read_cbc_gap(log_path):
+    # CBC prints "Gap:" when it stops early with a solution, otherwise derive it from the bound
+    try:
+        with open(log_path, encoding="utf-8", errors="replace") as f:
+            log = f.read()
+    except OSError:
+        return None
+    finally:
+        if os.path.exists(log_path):
+            os.remove(log_path)
+
+    def number(label):
+        match = re.search(rf"^{label}:\s+([-+\d.eE]+)", log, re.MULTILINE)
+        return float(match.group(1)) if match else None
+
+    gap = number("Gap")
+    objective, bound = number("Objective value"), number("Lower bound")
+    if gap is None and objective is not None and bound is not None:
+        gap = abs(objective - bound) / max(abs(objective), 1e-9)
+    return gap
 
 
-def solve_problem(prob):
-    prob.solve()
+def solve_problem(prob, warm_start=False, options=None):
+    options = get_solver_options(options)
+    log_path = None
+    if options["solver"] == "cbc":
+        log_dir = options["tmp_dir"] or tempfile.gettempdir()
+        log_path = os.path.join(log_dir, f"{uuid.uuid4().hex}-cbc.log")
+
+    start = time.perf_counter()
+    prob.solve(get_solver(options, warm_start, log_path))
+    stats = {
+        "solver": options["solver"],
+        "status": pulp.LpStatus[prob.status],
+        "solution_status": pulp.LpSolution[prob.sol_status],
+        "objective": None,
+        "gap": None,
+        "solve_time": time.perf_counter() - start,
+    }
+
+    if prob.sol_status in (pulp.LpSolutionOptimal, pulp.LpSolutionIntegerFeasible):
+        stats["objective"] = pulp.value(prob.objective)
+
+    if log_path:
+        stats["gap"] = read_cbc_gap(log_path)
+    elif hasattr(prob, "solverModel"):
+        try:
+            stats["gap"] = prob.solverModel.getInfo().mip_gap
+        except AttributeError:
+            pass
+    if stats["gap"] is None and prob.sol_status == pulp.LpSolutionOptimal:
+        stats["gap"] = 0.0
+    return stats
 
 
 def get_schedule_result(schedule, employees, shift_requirements):
-    num_days = len(shift_requirements["day"])
-    shifts = list(shift_requirements.keys())
+    num_days = get_num_days(shift_requirements)
+
+    schedule_result = {
+        f"Day {day + 1}": {shift: [] for shift in shift_requirements} for day in range(num_days)
+    }
+    # schedule only holds the sparse (emp, day, shift) index; the values are read in one pass
+    # and only the working slots are visited
+    keys = list(schedule)
+    values = np.fromiter(
+        (var.varValue or 0 for var in schedule.values()), dtype=float, count=len(keys)
+    )
+    for i in np.flatnonzero(values > 0.5):
+        emp, day, shift = keys[i]
+        schedule_result[f"Day {day + 1}"][shift].append(emp)
+    return schedule_result
+
+
+def find_independent_blocks(employees, shift_requirements):
+    # Shifts only interact through employees who can work more than one of them,
+    # so every connected group of shifts (with its employees) is an independent subproblem.
+    parent = {shift: shift for shift in shift_requirements}
+
+    def find(shift):
+        while parent[shift] != shift:
+            parent[shift] = parent[parent[shift]]
+            shift = parent[shift]
+        return shift
+
+    for emp in employees:
+        shifts = [shift for shift in get_employee_shifts(employees[emp]) if shift in parent]
+        for shift in shifts[1:]:
+            parent[find(shift)] = find(shifts[0])
+
+    blocks = {}
+    for shift in shift_requirements:
+        block = blocks.setdefault(find(shift), {"employees": {}, "shift_requirements": {}})
+        block["shift_requirements"][shift] = shift_requirements[shift]
+    for emp in employees:
+        # like compile_roster, shifts without requirements are skipped, and an employee
+        # with none left is not scheduled at all
+        shifts = [shift for shift in get_employee_shifts(employees[emp]) if shift in parent]
+        if shifts:
+            blocks[find(shifts[0])]["employees"][emp] = employees[emp]
+    return list(blocks.values())
+
+
+def get_engine(engine):
+    module_name, function_name = SCHEDULE_ENGINES[engine].split(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def select_engine(engine, employees, shift_requirements):
+    if engine == "auto":
+        size = len(employees) * get_num_days(shift_requirements)
+        return "heuristic" if size > HEURISTIC_THRESHOLD else "milp"
+    if engine not in SCHEDULE_ENGINES:
+        raise ValueError(f"Unknown scheduling engine: {engine}")
+    return engine
+
+
+def solve_block(
+    employees,
+    shift_requirements,
+    max_consecutive_days,
+    weights=None,
+    engine="milp",
+    options=None,
+):
+    engine = select_engine(engine, employees, shift_requirements)
+    schedule_result, stats = get_engine(engine)(
+        employees, shift_requirements, max_consecutive_days, weights, options
+    )
+    stats["engine"] = engine
+    return schedule_result, stats
+
+
+def solve_milp(employees, shift_requirements, max_consecutive_days, weights=None, options=None):
+    start = time.perf_counter()
+    roster = compile_roster(employees, shift_requirements)
+    prob = create_problem()
+    schedule = define_variables(employees, shift_requirements)
+    is_five_day_streak, is_one_day_streak = add_constraints(
+        prob, schedule, employees, shift_requirements, max_consecutive_days, roster
+    )
+    add_objective_function(
+        prob,
+        schedule,
+        employees,
+        shift_requirements,
+        is_five_day_streak,
+        is_one_day_streak,
+        roster,
+        weights,
+    )
+    build_time = time.perf_counter() - start
+
+    stats = solve_problem(prob, options=options)
+    start = time.perf_counter()
+    schedule_result = get_schedule_result(schedule, employees, shift_requirements)
+    stats.update(
+        variables=prob.numVariables(),
+        constraints=prob.numConstraints(),
+        build_time=build_time,
+        extract_time=time.perf_counter() - start,
+    )
+    return schedule_result, stats
+
+
+def merge_schedule_results(results, shift_requirements):
+    num_days = get_num_days(shift_requirements)
 
     schedule_result = {}
     for day in range(num_days):
         day_str = f"Day {day + 1}"
         schedule_result[day_str] = {}
-        for shift in shifts:
-            shift_employees = []
-            for emp in employees:
-                if pulp.value(schedule[(emp, day, shift)]) == 1:
-                    shift_employees.append(emp)
-            schedule_result[day_str][shift] = shift_employees
+        for shift in shift_requirements:
+            for result in results:
+                if shift in result[day_str]:
+                    schedule_result[day_str][shift] = result[day_str][shift]
     return schedule_result
+
+
+def merge_solver_stats(block_stats, wall_time):
+    def total(key):
+        values = [stats.get(key) for stats in block_stats]
+        return None if None in values else sum(values)
+
+    gaps = [stats["gap"] for stats in block_stats if stats.get("gap") is not None]
+    statuses = [stats["status"] for stats in block_stats]
+    return {
+        "status": min(
+            statuses,
+            key=lambda status: SOLVER_STATUS_ORDER.index(status)
+            if status in SOLVER_STATUS_ORDER
+            else 0,
+            # an incremental re-solve that touched no block solves nothing
+            default="Not Solved",
+        ),
+        "objective": total("objective"),
+        "gap": max(gaps) if gaps else None,
+        "variables": total("variables"),
+        "constraints": total("constraints"),
+        "build_time": total("build_time"),
+        "solve_time": total("solve_time"),
+        "extract_time": total("extract_time"),
+        "wall_time": wall_time,
+        "blocks": block_stats,
+    }
+
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def reset_executors():
+    # a forked child (gunicorn worker, job process) starts without pools, and with a fresh
+    # lock in case another thread held it at the fork
+    global _executors, _executors_lock
+    _executors = {}
+    _executors_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=reset_executors)
+
+
+def get_executor(max_workers=None):
+    # The pools are created lazily so every gunicorn worker owns its own after fork; one per
+    # size, so a caller's max_workers is never decided by whoever came first
+    with _executors_lock:
+        if max_workers not in _executors:
+            _executors[max_workers] = ProcessPoolExecutor(max_workers=max_workers)
+        return _executors[max_workers]
+
+
+def solve_schedule(
+    employees,
+    shift_requirements,
+    max_consecutive_days,
+    decompose=True,
+    max_workers=None,
+    weights=None,
+    engine="milp",
+    options=None,
+):
+    start = time.perf_counter()
+    if not decompose:
+        schedule_result, stats = solve_block(
+            employees, shift_requirements, max_consecutive_days, weights, engine, options
+        )
+        return schedule_result, merge_solver_stats([stats], time.perf_counter() - start)
+
+    blocks = find_independent_blocks(employees, shift_requirements)
+    max_workers = min(len(blocks), max_workers or os.cpu_count() or 1)
+    if len(blocks) == 1 or max_workers == 1:
+        results = [
+            solve_block(
+                block["employees"],
+                block["shift_requirements"],
+                max_consecutive_days,
+                weights,
+                engine,
+                options,
+            )
+            for block in blocks
+        ]
+    else:
+        executor = get_executor(max_workers)
+        futures = [
+            executor.submit(
+                solve_block,
+                block["employees"],
+                block["shift_requirements"],
+                max_consecutive_days,
+                weights,
+                engine,
+                options,
+            )
+            for block in blocks
+        ]
+        results = [future.result() for future in futures]
+    schedule_result = merge_schedule_results(
+        [block_result for block_result, _ in results], shift_requirements
+    )
+    return schedule_result, merge_solver_stats(
+        [stats for _, stats in results], time.perf_counter() - start
+    )
+
+
+def apply_schedule_delta(employees, shift_requirements, delta):
+    employees = copy.deepcopy(employees)
+    shift_requirements = copy.deepcopy(shift_requirements)
+    num_days = get_num_days(shift_requirements)
+    changes = {"days": set(), "employees": set(), "shifts": set(), "new_employees": set()}
+
+    # new hires or replaced employee records, these may move on any day; the shifts they
+    # leave change as well
+    for emp, employee in delta.get("employees", {}).items():
+        if emp not in employees:
+            changes["new_employees"].add(emp)
+        else:
+            changes["shifts"].update(get_employee_shifts(employees[emp]))
+        employees[emp] = employee
+        changes["employees"].add(emp)
+        changes["days"].update(range(num_days))
+
+    # leavers free their slots on every day
+    for emp in delta.get("removed_employees", []):
+        changes["shifts"].update(get_employee_shifts(employees.pop(emp)))
+        changes["employees"].add(emp)
+        changes["days"].update(range(num_days))
+
+    # extra leave, 1-based days like the roster data
+    for emp, off_days in delta.get("off_days", {}).items():
+        for off_day in off_days:
+            if off_day not in employees[emp]["off_days"]:
+                employees[emp]["off_days"].append(off_day)
+            changes["days"].add(off_day - 1)
+        changes["employees"].add(emp)
+
+    # requirement changes keyed by 1-based day
+    for shift, days in delta.get("shift_requirements", {}).items():
+        for day, required in days.items():
+            shift_requirements[shift][int(day) - 1] = required
+            changes["days"].add(int(day) - 1)
+        changes["shifts"].add(shift)
+
+    return employees, shift_requirements, changes
+
+
+def resolve_block(
+    employees,
+    shift_requirements,
+    max_consecutive_days,
+    previous_result,
+    changes,
+    window=3,
+    weights=None,
+    change_weight=1,
+    options=None,
+):
+    start = time.perf_counter()
+    roster = compile_roster(employees, shift_requirements)
+    num_days = roster["num_days"]
+    prob = create_problem()
+    schedule = define_variables(employees, shift_requirements)
+    is_five_day_streak, is_one_day_streak = add_constraints(
+        prob, schedule, employees, shift_requirements, max_consecutive_days, roster
+    )
+    add_objective_function(
+        prob,
+        schedule,
+        employees,
+        shift_requirements,
+        is_five_day_streak,
+        is_one_day_streak,
+        roster,
+        weights,
+    )
+
+    previous = {
+        (emp, int(day_str[4:]) - 1, shift)
+        for day_str, day_result in previous_result.items()
+        for shift, emps in day_result.items()
+        for emp in emps
+    }
+    days = [day for day in changes["days"] if 0 <= day < num_days]
+    if window is None:
+        first_day, last_day = 0, num_days - 1
+    elif days:
+        first_day, last_day = min(days) - window, max(days) + window
+    else:
+        first_day, last_day = num_days, -1
+
+    # warm start from the published schedule, freeze it outside the affected window
+    # and charge change_weight for every assignment that moves inside it
+    stability = []
+    for (emp, day, shift), var in schedule.items():
+        value = 1 if (emp, day, shift) in previous else 0
+        var.setInitialValue(value)
+        if emp in changes["new_employees"]:
+            continue
+        if first_day <= day <= last_day:
+            stability.append((var, -change_weight if value else change_weight))
+        else:
+            var.fixValue()
+    prob.objective += pulp.LpAffineExpression(
+        stability, constant=change_weight * sum(1 for _, coef in stability if coef < 0)
+    )
+
+    works = np.zeros((len(roster["employees"]), num_days), dtype=bool)
+    for emp, day, _ in previous:
+        if emp in roster["ids"] and day < num_days:
+            works[roster["ids"][emp], day] = True
+    for (emp, day), var in is_five_day_streak.items():
+        var.setInitialValue(int(works[roster["ids"][emp], day : day + 5].all()))
+    for (emp, day), var in is_one_day_streak.items():
+        row = works[roster["ids"][emp]]
+        neighbours = row[max(day - 1, 0) : day + 2].sum() - row[day]
+        var.setInitialValue(int(row[day] and not neighbours))
+
+    build_time = time.perf_counter() - start
+
+    stats = solve_problem(prob, warm_start=True, options=options)
+    if prob.status != pulp.LpStatusOptimal and (first_day > 0 or last_day < num_days - 1):
+        # the frozen part cannot absorb the change, so reopen the whole month
+        for var in schedule.values():
+            var.unfixValue()
+        stats = solve_problem(prob, warm_start=True, options=options)
+    start = time.perf_counter()
+    schedule_result = get_schedule_result(schedule, employees, shift_requirements)
+    stats.update(
+        engine="milp",
+        variables=prob.numVariables(),
+        constraints=prob.numConstraints(),
+        build_time=build_time,
+        extract_time=time.perf_counter() - start,
+    )
+    return schedule_result, stats
+
+
+def resolve_schedule(
+    employees,
+    shift_requirements,
+    max_consecutive_days,
+    previous_result,
+    changes,
+    window=3,
+    weights=None,
+    options=None,
+):
+    start = time.perf_counter()
+    results, block_stats = [], []
+    for block in find_independent_blocks(employees, shift_requirements):
+        # a block is re-solved when it has a changed employee or shift, or when its published
+        # schedule has someone it no longer holds, e.g. who moved shift or left
+        published = {
+            emp
+            for day_result in previous_result.values()
+            for shift in block["shift_requirements"]
+            for emp in day_result.get(shift, ())
+        }
+        if (
+            changes["employees"] & (block["employees"].keys() | published)
+            or changes["shifts"] & block["shift_requirements"].keys()
+            or published - block["employees"].keys()
+        ):
+            results.append(
+                resolve_block(
+                    block["employees"],
+                    block["shift_requirements"],
+                    max_consecutive_days,
+                    previous_result,
+                    changes,
+                    window,
+                    weights,
+                    options=options,
+                )
+            )
+            block_stats.append(results[-1][1])
+            results[-1] = results[-1][0]
+        else:
+            # untouched blocks keep their published schedule as it is
+            results.append(
+                {
+                    day_str: {shift: day_result[shift] for shift in block["shift_requirements"]}
+                    for day_str, day_result in previous_result.items()
+                }
+            )
+    schedule_result = merge_schedule_results(results, shift_requirements)
+    return schedule_result, merge_solver_stats(block_stats, time.perf_counter() - start)
@@ -0,0 +1,227 @@
+import math
+import time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils.auto_calendar import OBJECTIVE_WEIGHTS, compile_roster
+
+# cost of breaking a hard constraint, far above what the soft terms add up to for one employee
+HARD_PENALTY = 1000
+
+
+def row_costs(work, off_days, preferred_off_days, max_consecutive_days, weights):
+    # Same terms as the MILP, evaluated for every row of an employee x day matrix at once
+    num_days = work.shape[1]
+    cost = HARD_PENALTY * (work & off_days).sum(axis=1)
+    if num_days > max_consecutive_days:
+        windows = sliding_window_view(work, max_consecutive_days + 1, axis=1).sum(axis=2)
+        cost += HARD_PENALTY * (windows > max_consecutive_days).sum(axis=1)
+    cost += weights["preferred_off_day"] * (preferred_off_days & ~work).sum(axis=1)
+    if num_days >= 5:
+        five_day_streaks = sliding_window_view(work, 5, axis=1).all(axis=2)
+        cost += weights["five_day_streak"] * five_day_streaks.sum(axis=1)
+    padded = np.pad(work, ((0, 0), (1, 1)))
+    cost += weights["one_day_streak"] * (work & ~padded[:, :-2] & ~padded[:, 2:]).sum(axis=1)
+    return cost
+
+
+def build_initial_assignment(roster, shift_requirements, max_consecutive_days, senior):
+    # greedy day-by-day construction that keeps runs between 2 and 4 days where it can
+    num_employees, num_days = len(roster["employees"]), roster["num_days"]
+    assignment = np.full((num_employees, num_days), -1, dtype=np.int16)
+    run = np.zeros(num_employees, dtype=int)
+    total = np.zeros(num_employees, dtype=int)
+    run_score = np.array([1, 0, 0, 0, 3] + [4] * max(0, max_consecutive_days - 4))
+
+    # a senior who is the only one available on a coming day should rest before it
+    critical = np.zeros((num_employees, num_days), dtype=bool)
+    for pool in roster["pools"]:
+        seniors = pool[senior[pool]]
+        available = ~roster["off_days"][seniors]
+        critical[seniors] |= available & (available.sum(axis=0) == 1)
+    upcoming = np.zeros_like(critical)
+    for d in range(1, max_consecutive_days + 1):
+        upcoming[:, :-d] |= critical[:, d:]
+    upcoming &= ~critical
+
+    for day in range(num_days):
+        for s, shift in enumerate(shift_requirements):
+            pool = roster["pools"][s]
+            free = pool[assignment[pool, day] < 0]
+            available = ~roster["off_days"][free, day]
+            rested = run[free] < max_consecutive_days
+            score = (
+                run_score[np.minimum(run[free], len(run_score) - 1)]
+                + total[free] / (day + 1)
+                + 2 * upcoming[free, day]
+                + 10 * ~rested
+                + 100 * ~available
+            )
+            order = free[np.argsort(score, kind="stable")]
+            needed = shift_requirements[shift][day]
+            chosen = list(order[:needed])
+            seniors = order[senior[order]]
+            if len(seniors) and not senior[chosen].any():
+                chosen = [seniors[0]] + chosen[: needed - 1]
+            assignment[chosen, day] = s
+
+        worked = assignment[:, day] >= 0
+        run = np.where(worked, run + 1, 0)
+        total += worked
+    return assignment
+
+
+def count_coverage_gaps(assignment, required):
+    # |assigned - required| per shift and day; same-day swaps keep it, so only the greedy
+    # construction can leave a gap, when a pool has too few free employees
+    assigned = np.stack([(assignment == s).sum(axis=0) for s in range(len(required))])
+    return np.abs(assigned - required)
+
+
+def count_hard_violations(work, off_days, max_consecutive_days, seniors_on, coverage_gaps):
+    # the soft terms can pass HARD_PENALTY on a large roster, so feasibility is counted apart
+    violations = (work & off_days).sum() + (seniors_on == 0).sum() + coverage_gaps.sum()
+    if work.shape[1] > max_consecutive_days:
+        windows = sliding_window_view(work, max_consecutive_days + 1, axis=1).sum(axis=2)
+        violations += (windows > max_consecutive_days).sum()
+    return int(violations)
+
+
+def count_seniors(assignment, senior, num_shifts):
+    num_days = assignment.shape[1]
+    counts = np.zeros((num_shifts, num_days), dtype=int)
+    for s in range(num_shifts):
+        counts[s] = ((assignment == s) & senior[:, None]).sum(axis=0)
+    return counts
+
+
+def solve_heuristic(
+    employees,
+    shift_requirements,
+    max_consecutive_days,
+    weights=None,
+    options=None,
+    seed=0,
+    max_iterations=None,
+):
+    weights = weights or OBJECTIVE_WEIGHTS
+    time_limit = (options or {}).get("time_limit") or 5
+    build_started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    roster = compile_roster(employees, shift_requirements)
+    names = roster["employees"]
+    shifts = list(shift_requirements)
+    num_days = roster["num_days"]
+    senior = np.array([employees[emp]["level"] == "senior" for emp in names], dtype=bool)
+    roster["pools"] = [
+        np.array([roster["ids"][emp] for emp in roster["by_shift"][shift]], dtype=int)
+        for shift in shifts
+    ]
+    off_days, preferred_off_days = roster["off_days"], roster["preferred_off_days"]
+
+    assignment = build_initial_assignment(roster, shift_requirements, max_consecutive_days, senior)
+    work = assignment >= 0
+    costs = row_costs(work, off_days, preferred_off_days, max_consecutive_days, weights)
+    seniors_on = count_seniors(assignment, senior, len(shifts))
+    required = np.array([shift_requirements[shift] for shift in shifts], dtype=int)
+    coverage_gaps = count_coverage_gaps(assignment, required)
+    current = costs.sum() + HARD_PENALTY * ((seniors_on == 0).sum() + coverage_gaps.sum())
+    best, best_assignment = current, assignment.copy()
+    build_time = time.perf_counter() - build_started
+
+    # simulated annealing over same-day swaps, which keep every shift at its required size
+    slots = np.argwhere(work)
+    start_temperature, end_temperature = 10.0, 0.05
+    temperature = start_temperature
+    started = time.monotonic()
+    iteration = 0
+    while len(slots) and (max_iterations is None or iteration < max_iterations):
+        if iteration % 256 == 0:
+            # geometric cooling over whichever budget runs out first
+            elapsed = (time.monotonic() - started) / time_limit if time_limit else 1
+            if max_iterations:
+                elapsed = max(elapsed, iteration / max_iterations)
+            if elapsed >= 1:
+                break
+            temperature = start_temperature * (end_temperature / start_temperature) ** elapsed
+        iteration += 1
+
+        k = rng.integers(len(slots))
+        i, day = slots[k]
+        s = assignment[i, day]
+        pool = roster["pools"][s]
+        candidates = pool[~work[pool, day]]
+        if not len(candidates):
+            continue
+
+        # cost change for i leaving the slot
+        row_i = work[i : i + 1].copy()
+        row_i[0, day] = False
+        after_i = row_costs(
+            row_i, off_days[i : i + 1], preferred_off_days[i : i + 1], max_consecutive_days, weights
+        )
+        delta_i = after_i[0] - costs[i]
+
+        # cost change for every candidate taking it, evaluated as one matrix
+        rows = work[candidates].copy()
+        rows[:, day] = True
+        after = row_costs(
+            rows,
+            off_days[candidates],
+            preferred_off_days[candidates],
+            max_consecutive_days,
+            weights,
+        )
+        delta = delta_i + after - costs[candidates]
+        if senior[i] and seniors_on[s, day] == 1:
+            delta = delta + HARD_PENALTY * ~senior[candidates]
+        elif not senior[i] and seniors_on[s, day] == 0:
+            delta = delta - HARD_PENALTY * senior[candidates]
+
+        c = int(np.argmin(delta))
+        if delta[c] > 0 and rng.random() >= math.exp(-delta[c] / temperature):
+            continue
+
+        j = candidates[c]
+        assignment[i, day], assignment[j, day] = -1, s
+        work[i, day], work[j, day] = False, True
+        seniors_on[s, day] += int(senior[j]) - int(senior[i])
+        costs[i] += delta_i
+        costs[j] = after[c]
+        slots[k] = (j, day)
+        current += delta[c]
+        if current < best:
+            best, best_assignment = current, assignment.copy()
+
+    solve_time = time.monotonic() - started
+    extract_started = time.perf_counter()
+    schedule_result = {}
+    for day in range(num_days):
+        day_str = f"Day {day + 1}"
+        schedule_result[day_str] = {}
+        for s, shift in enumerate(shifts):
+            schedule_result[day_str][shift] = [
+                names[i] for i in np.nonzero(best_assignment[:, day] == s)[0]
+            ]
+
+    violations = count_hard_violations(
+        best_assignment >= 0,
+        off_days,
+        max_consecutive_days,
+        count_seniors(best_assignment, senior, len(shifts)),
+        count_coverage_gaps(best_assignment, required),
+    )
+    stats = {
+        "solver": "annealing",
+        "status": "Infeasible" if violations else "Feasible",
+        "solution_status": "No Solution Found" if violations else "Solution Found",
+        "objective": float(best),
+        "gap": None,
+        "hard_violations": violations,
+        "iterations": iteration,
+        "build_time": build_time,
+        "solve_time": solve_time,
+        "extract_time": time.perf_counter() - extract_started,
+    }
+    return schedule_result, stats
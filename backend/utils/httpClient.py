@@ -0,0 +1,86 @@
+import os
+import threading
+
+import requests
+from linebot.http_client import RequestsHttpClient, RequestsHttpResponse
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+httpPoolConnections = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))
+httpPoolMaxsize = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))
+httpConnectTimeout = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+httpReadTimeout = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+httpRetries = int(os.getenv("HTTP_RETRIES", "3"))
+httpBackoffFactor = float(os.getenv("HTTP_BACKOFF_FACTOR", "0.3"))
+
+_session = None
+_sessionPid = None
+_sessionLock = threading.Lock()
+
+
+class PooledSession(requests.Session):
+    # requests has no session-wide timeout, so fill one in for every call that leaves it out
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", (httpConnectTimeout, httpReadTimeout))
+        return super().request(method, url, **kwargs)
+
+
+def createSession():
+    # 429 and 5xx are retried with exponential backoff, honouring Retry-After; a read error
+    # is not, the request may already have gone through and reply tokens and auth codes are
+    # single use
+    retry = Retry(
+        total=httpRetries,
+        read=0,
+        backoff_factor=httpBackoffFactor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=None,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=httpPoolConnections, pool_maxsize=httpPoolMaxsize, max_retries=retry
+    )
+    session = PooledSession()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def getHttpSession():
+    # one keep-alive pool per process; sockets must not be shared across gunicorn forks
+    global _session, _sessionPid
+    if _session is not None and _sessionPid == os.getpid():
+        return _session
+    with _sessionLock:
+        if _session is None or _sessionPid != os.getpid():
+            _session = createSession()
+            _sessionPid = os.getpid()
+    return _session
+
+
+class PooledLineHttpClient(RequestsHttpClient):
+    # LineBotApi http_client that sends through the shared session instead of requests.*
+    def get(self, url, headers=None, params=None, stream=False, timeout=None):
+        response = getHttpSession().get(
+            url, headers=headers, params=params, stream=stream, timeout=timeout or self.timeout
+        )
+        return RequestsHttpResponse(response)
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        response = getHttpSession().post(
+            url, headers=headers, data=data, timeout=timeout or self.timeout
+        )
+        return RequestsHttpResponse(response)
+
+    def delete(self, url, headers=None, data=None, timeout=None):
+        response = getHttpSession().delete(
+            url, headers=headers, data=data, timeout=timeout or self.timeout
+        )
+        return RequestsHttpResponse(response)
+
+    def put(self, url, headers=None, data=None, timeout=None):
+        response = getHttpSession().put(
+            url, headers=headers, data=data, timeout=timeout or self.timeout
+        )
+        return RequestsHttpResponse(response)
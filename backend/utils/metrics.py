@@ -0,0 +1,274 @@
+import atexit
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# every process writes its own snapshot here and /metrics adds them up across gunicorn workers;
+# set it to "" to keep metrics inside the process that serves /metrics
+metricsDir = os.getenv("METRICS_DIR", os.path.join(tempfile.gettempdir(), "app_metrics"))
+metricsFlushInterval = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+# snapshots of workers that are gone are dropped once this old; their counters then reset,
+# which Prometheus' rate() already handles as it does for a restart
+metricsRetention = float(os.getenv("METRICS_RETENTION", "604800"))
+
+latencyBuckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+sizeBuckets = (100, 1000, 10000, 100000, 1000000)
+
+# name: (type, help, histogram buckets)
+metricDefinitions = {
+    "http_request_seconds": ("histogram", "Request latency by endpoint.", latencyBuckets),
+    "line_webhook_seconds": (
+        "histogram",
+        "/callback phases: signature check, body parse, event dispatch.",
+        latencyBuckets,
+    ),
+    "line_webhook_failures_total": ("counter", "/callback requests that failed.", None),
+    "line_event_seconds": (
+        "histogram",
+        "Per event phases: queue wait, dedup claim, handler incl. Mongo, LINE reply.",
+        latencyBuckets,
+    ),
+    "line_events_total": ("counter", "Webhook events by type and outcome.", None),
+    "mongo_operation_seconds": ("histogram", "Mongo handler calls.", latencyBuckets),
+    "schedule_solve_seconds": ("histogram", "Auto-calendar wall time per solve.", latencyBuckets),
+    "schedule_phase_seconds": (
+        "histogram",
+        "Auto-calendar model build, solver and result extraction time per block.",
+        latencyBuckets,
+    ),
+    "schedule_blocks_total": ("counter", "Solved blocks by engine, solver and status.", None),
+    "schedule_model_variables": ("histogram", "Variables per solved block.", sizeBuckets),
+    "schedule_model_constraints": ("histogram", "Constraints per solved block.", sizeBuckets),
+}
+
+_values = {}
+_valuesPid = None
+_valuesStarted = None
+_valuesDirty = False
+_valuesLock = threading.Lock()
+
+
+def getValues():
+    # metrics recorded before a fork belong to the parent, every process starts from zero
+    global _values, _valuesPid, _valuesStarted
+    if _valuesPid != os.getpid():
+        _values = {}
+        _valuesPid = os.getpid()
+        _valuesStarted = time.time_ns()
+        if metricsDir:
+            threading.Thread(target=runMetricsFlusher, name="metrics-flush", daemon=True).start()
+    return _values
+
+
+def labelKey(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def incCounter(name, amount=1, **labels):
+    global _valuesDirty
+    with _valuesLock:
+        values = getValues()
+        key = (name, labelKey(labels))
+        values[key] = values.get(key, 0) + amount
+        _valuesDirty = True
+
+
+def observe(name, value, **labels):
+    global _valuesDirty
+    buckets = metricDefinitions[name][2]
+    with _valuesLock:
+        values = getValues()
+        key = (name, labelKey(labels))
+        histogram = values.get(key)
+        if histogram is None:
+            # one count per bucket plus +Inf, then sum and count
+            histogram = values[key] = [0] * (len(buckets) + 3)
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                histogram[i] += 1
+                break
+        else:
+            histogram[len(buckets)] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+        _valuesDirty = True
+
+
+@contextmanager
+def timer(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def timed(name, **labels):
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def recordSolverStats(stats):
+    # the block stats already carry the phase timings, so nothing inside the solver is wrapped
+    observe("schedule_solve_seconds", stats.get("wall_time") or 0)
+    for block in stats.get("blocks") or [stats]:
+        engine = block.get("engine") or "milp"
+        incCounter(
+            "schedule_blocks_total",
+            engine=engine,
+            solver=block.get("solver"),
+            status=block["status"],
+        )
+        for phase in ("build", "solve", "extract"):
+            if block.get(phase + "_time") is not None:
+                observe(
+                    "schedule_phase_seconds", block[phase + "_time"], engine=engine, phase=phase
+                )
+        if block.get("variables") is not None:
+            observe("schedule_model_variables", block["variables"], engine=engine)
+            observe("schedule_model_constraints", block["constraints"], engine=engine)
+
+
+def snapshotMetrics():
+    # histograms are copied, the live lists keep changing under other threads
+    with _valuesLock:
+        return [
+            [name, list(labels), list(value) if isinstance(value, list) else value]
+            for (name, labels), value in getValues().items()
+        ]
+
+
+def getSnapshotPath():
+    # pid plus start time, so a recycled pid never overwrites a dead worker's counters
+    with _valuesLock:
+        getValues()
+    return os.path.join(metricsDir, f"{_valuesPid}-{_valuesStarted}.json")
+
+
+def flushMetrics():
+    global _valuesDirty
+    if not metricsDir:
+        return
+    with _valuesLock:
+        if not _valuesDirty:
+            return
+        _valuesDirty = False
+    path = getSnapshotPath()
+    os.makedirs(metricsDir, exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(snapshotMetrics(), f)
+    os.replace(path + ".tmp", path)
+
+
+def runMetricsFlusher():
+    lastPruned = time.monotonic()
+    while True:
+        time.sleep(metricsFlushInterval)
+        try:
+            flushMetrics()
+            if time.monotonic() - lastPruned > 3600:
+                lastPruned = time.monotonic()
+                pruneMetrics()
+        except OSError as e:
+            print("Metrics flush fail. Reason: " + str(e))
+
+
+def isProcessAlive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def pruneMetrics():
+    # an idle live worker does not rewrite its file, so age alone is not enough
+    cutoff = time.time() - metricsRetention
+    for path in glob.glob(os.path.join(metricsDir, "*.json*")):
+        try:
+            pid = int(os.path.basename(path).split("-", 1)[0])
+            if os.path.getmtime(path) < cutoff and not isProcessAlive(pid):
+                os.unlink(path)
+        except (OSError, ValueError):
+            continue
+
+
+def mergeMetrics(merged, snapshot):
+    for name, labels, value in snapshot:
+        key = (name, tuple(tuple(label) for label in labels))
+        if key not in merged:
+            merged[key] = value
+        elif isinstance(value, list):
+            merged[key] = [a + b for a, b in zip(merged[key], value)]
+        else:
+            merged[key] += value
+
+
+def collectMetrics():
+    # dead workers' files stay, so counters never go backwards when gunicorn recycles one
+    merged = {}
+    ownPath = getSnapshotPath() if metricsDir else None
+    for path in glob.glob(os.path.join(metricsDir, "*.json")) if metricsDir else []:
+        if path == ownPath:
+            continue
+        try:
+            with open(path, encoding="utf-8") as f:
+                mergeMetrics(merged, json.load(f))
+        except (OSError, ValueError):
+            continue
+    mergeMetrics(merged, snapshotMetrics())
+    return merged
+
+
+def escapeLabel(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def formatLabels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escapeLabel(value)}"' for name, value in pairs) + "}"
+
+
+def renderMetrics():
+    # Prometheus text exposition format
+    merged = collectMetrics()
+    lines = []
+    for name, (kind, description, buckets) in metricDefinitions.items():
+        series = sorted(
+            (labels, value) for (metric, labels), value in merged.items() if metric == name
+        )
+        if not series:
+            continue
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in series:
+            if kind == "counter":
+                lines.append(f"{name}{formatLabels(labels)} {value:g}")
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ("+Inf",), value):
+                cumulative += count
+                le = bound if bound == "+Inf" else f"{bound:g}"
+                lines.append(f"{name}_bucket{formatLabels(labels, [('le', le)])} {cumulative}")
+            lines.append(f"{name}_sum{formatLabels(labels)} {value[-2]:g}")
+            lines.append(f"{name}_count{formatLabels(labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+atexit.register(flushMetrics)
@@ -0,0 +1,44 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import tempfile
+import time
+
+# off unless configured: a request is profiled when its X-Profile header carries PROFILE_TOKEN,
+# or for a PROFILE_SAMPLE_RATE share of all requests
+profileToken = os.getenv("PROFILE_TOKEN")
+profileSampleRate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+profileDir = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "app_profiles"))
+profileTop = int(os.getenv("PROFILE_TOP", "25"))
+
+
+def shouldProfile(headerValue):
+    if profileToken and headerValue == profileToken:
+        return True
+    return profileSampleRate > 0 and random.random() < profileSampleRate
+
+
+def startProfile():
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # another profiler is already active in this thread
+        return None
+    return profiler
+
+
+def finishProfile(profiler, label):
+    # the full profile goes to a .prof file for snakeviz/pstats, the top entries to the log
+    profiler.disable()
+    os.makedirs(profileDir, exist_ok=True)
+    name = f"{label}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof"
+    path = os.path.join(profileDir, name)
+    profiler.dump_stats(path)
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(profileTop)
+    logging.info("Profile of %s written to %s\n%s", label, path, summary.getvalue())
+    return path
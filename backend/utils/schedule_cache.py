@@ -0,0 +1,226 @@
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from utils.metrics import recordSolverStats
+
+CACHE_SIZE = int(os.getenv("SCHEDULE_CACHE_SIZE", "32"))
+CACHE_TTL = int(os.getenv("SCHEDULE_CACHE_TTL", "86400"))
+CACHE_DIR = os.getenv("SCHEDULE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "schedule_cache"))
+SOLVED_STATUSES = ("Optimal", "Feasible")
+# how often a process sweeps a directory for files nobody has written for a whole TTL
+PRUNE_INTERVAL = int(os.getenv("SCHEDULE_PRUNE_INTERVAL", "3600"))
+
+_memory_cache = OrderedDict()
+_memory_lock = threading.Lock()
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+_last_pruned = {}
+_prune_lock = threading.Lock()
+
+
+def schedule_fingerprint(
+    employees, shift_requirements, max_consecutive_days, weights, engine="milp", options=None
+):
+    # Canonical JSON (sorted keys, no whitespace) so equal inputs always hash the same
+    inputs = {
+        "employees": employees,
+        "shift_requirements": shift_requirements,
+        "max_consecutive_days": max_consecutive_days,
+        "weights": weights,
+    }
+    if engine != "milp":
+        inputs["engine"] = engine
+    # a time limit, gap or other solver may return a different schedule for the same roster
+    solver_options = {
+        name: value
+        for name, value in (options or {}).items()
+        if name in ("solver", "time_limit", "gap") and value is not None
+    }
+    if solver_options:
+        inputs["solver_options"] = solver_options
+    payload = json.dumps(
+        inputs,
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def resolve_fingerprint(key, previous_result, changes, window):
+    # a re-plan depends on the published schedule it starts from and how much of it may move,
+    # not only on the roster after the change
+    payload = json.dumps(
+        {
+            "mode": "resolve",
+            "key": key,
+            "previous_result": previous_result,
+            "changes": {name: sorted(values) for name, values in changes.items()},
+            "window": window,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_cache_path(key):
+    return os.path.join(CACHE_DIR, f"{key}.solution.json")
+
+
+def get_cached_solution(key):
+    # tier 1: this worker's LRU, expiring with the file it mirrors
+    with _memory_lock:
+        if key in _memory_cache:
+            solution, stored_at = _memory_cache[key]
+            if time.time() - stored_at <= CACHE_TTL:
+                _memory_cache.move_to_end(key)
+                return solution
+            del _memory_cache[key]
+
+    # tier 2: the directory shared by every gunicorn worker on this host
+    path = get_cache_path(key)
+    try:
+        stored_at = os.path.getmtime(path)
+        if time.time() - stored_at > CACHE_TTL:
+            return None
+        with open(path, encoding="utf-8") as f:
+            solution = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    remember_solution(key, solution, stored_at)
+    return solution
+
+
+def remember_solution(key, solution, stored_at=None):
+    with _memory_lock:
+        _memory_cache[key] = (solution, stored_at or time.time())
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+
+
+def write_json_file(path, data):
+    # write to a temp file first so other workers never read a half-written file
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def make_solution(schedule_result, stats):
+    # what gets cached and returned: the schedule plus how the solver got there
+    return {"schedule": schedule_result, "solver": stats}
+
+
+def is_solved(solution):
+    # only these are cached, a time-out or infeasible result would be served for a whole TTL;
+    # a re-plan that touched no block keeps the published schedule without solving anything
+    stats = solution["solver"]
+    return stats["status"] in SOLVED_STATUSES or stats.get("blocks") == []
+
+
+def set_cached_solution(key, solution):
+    remember_solution(key, solution)
+    try:
+        write_json_file(get_cache_path(key), solution)
+    except OSError as e:
+        print("Write schedule cache fail. Reason: " + str(e))
+    # expired solutions, their lock files and leftover temp files
+    prune_directory(CACHE_DIR, CACHE_TTL)
+
+
+def prune_directory(directory, max_age):
+    # the files on disk are only ever added to, so whoever writes sweeps now and then, at most
+    # once per PRUNE_INTERVAL and process; opening a lock file truncates it, so an old mtime
+    # means nobody has locked it since
+    now = time.monotonic()
+    with _prune_lock:
+        if now - _last_pruned.get(directory, -PRUNE_INTERVAL) < PRUNE_INTERVAL:
+            return 0
+        _last_pruned[directory] = now
+
+    cutoff = time.time() - max_age
+    removed = 0
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < cutoff:
+                        os.unlink(entry.path)
+                        removed += 1
+                except FileNotFoundError:
+                    # another worker swept it first
+                    continue
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print("Prune " + directory + " fail. Reason: " + str(e))
+    return removed
+
+
+@contextmanager
+def schedule_lock(key):
+    # flock on a per-key file serialises identical solves across gunicorn workers
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(os.path.join(CACHE_DIR, f"{key}.lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def get_or_solve_solution(key, solve):
+    # solve() returns (schedule_result, stats) like solve_schedule; an unsolved result is
+    # returned to the callers waiting on it but not cached, see is_solved
+    solution = get_cached_solution(key)
+    if solution is not None:
+        return solution
+
+    # the first caller for a key solves it, later callers in this process wait for its result
+    with _in_flight_lock:
+        flight = _in_flight.get(key)
+        is_leader = flight is None
+        if is_leader:
+            flight = _in_flight[key] = {"done": threading.Event(), "result": None, "error": None}
+
+    if not is_leader:
+        flight["done"].wait()
+        if flight["error"] is not None:
+            raise flight["error"]
+        return flight["result"]
+
+    try:
+        with schedule_lock(key):
+            # another worker may have finished the same solve while we waited for the lock
+            solution = get_cached_solution(key)
+            if solution is None:
+                solution = make_solution(*solve())
+                recordSolverStats(solution["solver"])
+                if is_solved(solution):
+                    set_cached_solution(key, solution)
+        flight["result"] = solution
+        return solution
+    except Exception as e:
+        flight["error"] = e
+        raise
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
+        flight["done"].set()
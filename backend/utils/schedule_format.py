@@ -0,0 +1,134 @@
+import numpy as np
+
+COMPACT_ENCODINGS = ("bitset", "rle")
+OFF = -1
+
+
+def get_day_number(day_str):
+    # "Day 12" -> 12
+    return int(day_str.split()[-1])
+
+
+def get_day_range(schedule_result, first_day=None, last_day=None):
+    num_days = len(schedule_result)
+    first_day = max(first_day or 1, 1)
+    last_day = min(last_day or num_days, num_days)
+    if first_day > last_day:
+        raise ValueError(f"no days between {first_day} and {last_day} in a {num_days}-day schedule")
+    return first_day, last_day
+
+
+def filter_schedule(schedule_result, first_day=None, last_day=None, names=None):
+    # the nested format, cut down to a day range and/or a few employees
+    first_day, last_day = get_day_range(schedule_result, first_day, last_day)
+    selected = set(names) if names else None
+    return {
+        day_str: {
+            shift: [emp for emp in assigned if selected is None or emp in selected]
+            for shift, assigned in day_result.items()
+        }
+        for day_str, day_result in schedule_result.items()
+        if first_day <= get_day_number(day_str) <= last_day
+    }
+
+
+def get_schedule_shifts(schedule_result):
+    return list(next(iter(schedule_result.values()), {}))
+
+
+def build_assignment_matrix(schedule_result, names, shifts, first_day, last_day):
+    # employees x days of shift indices, OFF where the employee is not scheduled;
+    # filled one (day, shift) column slice at a time rather than per employee and day
+    ids = {emp: i for i, emp in enumerate(names)}
+    matrix = np.full((len(names), last_day - first_day + 1), OFF, dtype=np.int16)
+    for day in range(first_day, last_day + 1):
+        day_result = schedule_result[f"Day {day}"]
+        for s, shift in enumerate(shifts):
+            rows = [ids[emp] for emp in day_result.get(shift, ()) if emp in ids]
+            matrix[rows, day - first_day] = s
+    return matrix
+
+
+def encode_runs(matrix):
+    # per employee [value, length, value, length, ...]; all rows are split in one pass by
+    # treating the matrix as one long sequence that restarts at every row boundary
+    num_rows, num_days = matrix.shape
+    if num_rows == 0 or num_days == 0:
+        return [[] for _ in range(num_rows)]
+    starts = np.ones(matrix.shape, dtype=bool)
+    starts[:, 1:] = matrix[:, 1:] != matrix[:, :-1]
+    flat_starts = np.flatnonzero(starts)
+    lengths = np.diff(np.append(flat_starts, matrix.size))
+    values = matrix.ravel()[flat_starts]
+    pairs = np.column_stack((values, lengths))
+    row_breaks = np.searchsorted(flat_starts, np.arange(1, num_rows) * num_days)
+    return [row.ravel().tolist() for row in np.split(pairs, row_breaks)]
+
+
+def encode_bitsets(matrix, shifts):
+    # per employee {shift: hex}, bit i set when the employee works that shift on the i-th day
+    # of the range; shifts the employee never works are left out
+    bitsets = [{} for _ in range(matrix.shape[0])]
+    for s, shift in enumerate(shifts):
+        packed = np.packbits(matrix == s, axis=1, bitorder="little")
+        for i in np.flatnonzero(packed.any(axis=1)):
+            bitsets[i][shift] = format(int.from_bytes(packed[i].tobytes(), "little"), "x")
+    return bitsets
+
+
+def get_roster_table(names, shifts, employees=None):
+    # columnar, with levels and shifts as indices, so a large roster costs a few bytes a head
+    table = {"name": names}
+    if not employees:
+        return table
+    levels = sorted({employees[emp]["level"] for emp in names})
+    level_ids = {level: i for i, level in enumerate(levels)}
+    shift_ids = {shift: i for i, shift in enumerate(shifts)}
+    table["levels"] = levels
+    table["level"] = [level_ids[employees[emp]["level"]] for emp in names]
+    table["shifts"] = [
+        [
+            shift_ids[shift]
+            for shift in employees[emp].get("shifts") or [employees[emp]["shift"]]
+            if shift in shift_ids
+        ]
+        for emp in names
+    ]
+    return table
+
+
+def compact_schedule(
+    schedule_result, employees=None, first_day=None, last_day=None, names=None, encoding="bitset"
+):
+    # roster table plus one encoded row per employee instead of a name list per day and shift
+    if encoding not in COMPACT_ENCODINGS:
+        raise ValueError(f"unknown encoding {encoding}")
+    first_day, last_day = get_day_range(schedule_result, first_day, last_day)
+    shifts = get_schedule_shifts(schedule_result)
+    if employees:
+        all_names = list(employees)
+    else:
+        # without the request's roster only employees who work at least once are known
+        all_names = sorted(
+            {
+                emp
+                for day_result in schedule_result.values()
+                for assigned in day_result.values()
+                for emp in assigned
+            }
+        )
+    if names:
+        selected = set(names)
+        all_names = [emp for emp in all_names if emp in selected]
+
+    matrix = build_assignment_matrix(schedule_result, all_names, shifts, first_day, last_day)
+    return {
+        "format": "compact",
+        "encoding": encoding,
+        "first_day": first_day,
+        "last_day": last_day,
+        "shifts": shifts,
+        "off": OFF,
+        "roster": get_roster_table(all_names, shifts, employees),
+        "assignments": encode_runs(matrix) if encoding == "rle" else encode_bitsets(matrix, shifts),
+    }
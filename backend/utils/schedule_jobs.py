@@ -0,0 +1,237 @@
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import tempfile
+import threading
+import time
+import uuid
+
+from utils.metrics import recordSolverStats
+from utils.schedule_cache import (
+    get_cached_solution,
+    is_solved,
+    make_solution,
+    prune_directory,
+    schedule_lock,
+    set_cached_solution,
+    write_json_file,
+)
+
+JOB_WORKERS = int(os.getenv("SCHEDULE_JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("SCHEDULE_JOB_QUEUE_SIZE", "16"))
+JOB_TIME_LIMIT = float(os.getenv("SCHEDULE_JOB_TIME_LIMIT", "300"))
+JOB_DIR = os.getenv("SCHEDULE_JOB_DIR", os.path.join(tempfile.gettempdir(), "schedule_jobs"))
+# finished job records, cancel and active markers are kept this long after their last update
+JOB_RETENTION = int(os.getenv("SCHEDULE_JOB_RETENTION", "86400"))
+FINISHED_STATUSES = ("done", "failed", "cancelled", "timeout")
+# time for a job that hit its limit to be killed and recorded
+JOB_STALE_GRACE = 30
+
+_queue = None
+_queue_pid = None
+_queue_lock = threading.Lock()
+_submit_lock = threading.Lock()
+
+
+def get_job_path(job_id, suffix="json"):
+    return os.path.join(JOB_DIR, f"{job_id}.{suffix}")
+
+
+def get_job(job_id):
+    # job records live on disk so any gunicorn worker can answer a status poll
+    try:
+        with open(get_job_path(job_id), encoding="utf-8") as f:
+            job = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if job["status"] not in FINISHED_STATUSES and is_stale_job(job):
+        # its worker died with the job or with the in-memory queue holding it, e.g. on a
+        # recycle, so pollers get a final status instead of waiting forever
+        job.update(status="failed", error="job was lost when its worker stopped")
+    return job
+
+
+def is_stale_job(job):
+    # solve_job enforces the limit on a running job; a job queued longer than the limit is
+    # given up, see dispatch_jobs, and a new request for its inputs gets a new job
+    if job["status"] == "running":
+        return time.time() > job["startedAt"] + JOB_TIME_LIMIT + JOB_STALE_GRACE
+    return time.time() > job["createdAt"] + JOB_TIME_LIMIT
+
+
+def update_job(job, **fields):
+    job.update(fields)
+    write_json_file(get_job_path(job["id"]), job)
+    return job
+
+
+def get_job_queue():
+    # the queue and its dispatcher threads are started lazily, once per process after fork
+    global _queue, _queue_pid
+    with _queue_lock:
+        if _queue is None or _queue_pid != os.getpid():
+            _queue = queue.Queue(maxsize=JOB_QUEUE_SIZE)
+            _queue_pid = os.getpid()
+            for _ in range(JOB_WORKERS):
+                threading.Thread(target=dispatch_jobs, args=(_queue,), daemon=True).start()
+    return _queue
+
+
+def submit_job(key, inputs, time_limit=None):
+    # a record untouched for that long is finished or stale, never one still being worked on
+    prune_directory(JOB_DIR, max(JOB_RETENTION, JOB_TIME_LIMIT + JOB_STALE_GRACE))
+    job = {
+        "id": uuid.uuid4().hex,
+        "key": key,
+        "status": "queued",
+        "createdAt": time.time(),
+        "startedAt": None,
+        "finishedAt": None,
+        "error": None,
+    }
+    if get_cached_solution(key) is not None:
+        return update_job(job, status="done", finishedAt=time.time())
+
+    # identical inputs share the job that is already queued or running
+    active_job = get_active_job(key)
+    if active_job is not None:
+        return active_job
+
+    time_limit = min(time_limit or JOB_TIME_LIMIT, JOB_TIME_LIMIT)
+    # nothing is written for a job that never made it into the queue; the dispatcher waits
+    # for the lock so its updates land after the queued record
+    with _submit_lock:
+        get_job_queue().put_nowait((job, inputs, time_limit))
+        update_job(job)
+        write_json_file(get_job_path(key, "active"), job["id"])
+    return job
+
+
+def get_active_job(key):
+    try:
+        with open(get_job_path(key, "active"), encoding="utf-8") as f:
+            job = get_job(json.load(f))
+    except (OSError, ValueError):
+        return None
+    if job is None or job["status"] in FINISHED_STATUSES or is_stale_job(job):
+        return None
+    return job
+
+
+def cancel_job(job_id):
+    job = get_job(job_id)
+    if job is None or job["status"] in FINISHED_STATUSES:
+        return job
+    # the worker that owns the job may be another process, so leave it a marker
+    open(get_job_path(job_id, "cancel"), "w").close()
+    if job["status"] == "queued":
+        update_job(job, status="cancelled", finishedAt=time.time())
+    return job
+
+
+def is_cancelled(job_id):
+    return os.path.exists(get_job_path(job_id, "cancel"))
+
+
+def wait_for_job(job_id, timeout):
+    deadline = time.monotonic() + timeout
+    job = get_job(job_id)
+    while job is not None and job["status"] not in FINISHED_STATUSES:
+        if time.monotonic() >= deadline:
+            break
+        time.sleep(0.25)
+        job = get_job(job_id)
+    return job
+
+
+def dispatch_jobs(job_queue):
+    while True:
+        job, inputs, time_limit = job_queue.get()
+        with _submit_lock:
+            pass
+        try:
+            if is_cancelled(job["id"]):
+                update_job(job, status="cancelled", finishedAt=time.time())
+            elif is_stale_job(job):
+                # pollers were already told it failed, so it must not come back to life
+                update_job(
+                    job,
+                    status="failed",
+                    error="job waited longer than its time limit in the queue",
+                    finishedAt=time.time(),
+                )
+            else:
+                execute_job(job, inputs, time_limit)
+        except Exception as e:
+            print("Schedule job fail. Reason: " + str(e))
+            update_job(job, status="failed", error=str(e), finishedAt=time.time())
+        finally:
+            job_queue.task_done()
+
+
+def execute_job(job, inputs, time_limit):
+    # hold the per-key lock so synchronous requests for the same inputs wait for this solve
+    with schedule_lock(job["key"]):
+        if get_cached_solution(job["key"]) is not None:
+            update_job(job, status="done", finishedAt=time.time())
+        else:
+            solve_job(job, inputs, time_limit)
+
+
+def solve_job(job, inputs, time_limit):
+    update_job(job, status="running", startedAt=time.time())
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=run_job, args=(sender, inputs))
+    process.start()
+    sender.close()
+
+    deadline = time.monotonic() + time_limit
+    status, payload = None, None
+    while status is None:
+        if receiver.poll(0.5):
+            try:
+                status, payload = receiver.recv()
+            except EOFError:
+                status, payload = "failed", "solver process exited unexpectedly"
+        elif is_cancelled(job["id"]):
+            status = "cancelled"
+        elif time.monotonic() > deadline:
+            status, payload = "timeout", f"time limit of {time_limit}s exceeded"
+
+    if process.is_alive():
+        kill_job_process(process)
+    process.join()
+    receiver.close()
+
+    if status == "done":
+        recordSolverStats(payload["solver"])
+        if is_solved(payload):
+            set_cached_solution(job["key"], payload)
+            payload = None
+        else:
+            status = "failed"
+            payload = "no schedule found, solver status: " + payload["solver"]["status"]
+    update_job(job, status=status, error=payload, finishedAt=time.time())
+
+
+def run_job(sender, inputs):
+    # own process group, so killing the job also stops CBC and the block pool
+    os.setpgrp()
+    try:
+        # imported in the job process, the web worker never needs PuLP for a queued solve
+        from utils.auto_calendar import solve_schedule
+
+        sender.send(("done", make_solution(*solve_schedule(**inputs))))
+    except Exception as e:
+        sender.send(("failed", str(e)))
+    finally:
+        sender.close()
+
+
+def kill_job_process(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        process.kill()
@@ -0,0 +1,75 @@
+import mimetypes
+import os
+import re
+
+from flask import jsonify, request, send_file
+
+# hashed build output never changes under the same name, everything else is revalidated
+immutableMaxAge = int(os.getenv("STATIC_IMMUTABLE_MAX_AGE", "31536000"))
+# CRA names bundles main.1a2b3c4d.js and 453.8e1f0a2b.chunk.css
+hashedNamePattern = re.compile(r"\.[0-9a-f]{8,}\.(?:chunk\.)?[a-z0-9]+$")
+# written next to each asset by scripts/compress_static.py, best first
+encodingSuffixes = [("br", ".br"), ("gzip", ".gz")]
+
+
+def buildAssetManifest(staticDir):
+    # one walk of the build output at startup, requests only do a dict lookup after this
+    manifest = {}
+    if not os.path.isdir(staticDir):
+        return manifest
+    for root, _, files in os.walk(staticDir):
+        for name in files:
+            if name.endswith(tuple(suffix for _, suffix in encodingSuffixes)):
+                continue
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            variants = {}
+            for encoding, suffix in encodingSuffixes:
+                if os.path.exists(path + suffix):
+                    variants[encoding] = path + suffix
+            key = os.path.relpath(path, staticDir).replace(os.sep, "/")
+            manifest[key] = {
+                "path": path,
+                "mimetype": mimetypes.guess_type(name)[0] or "application/octet-stream",
+                "etag": f"{stat.st_size:x}-{stat.st_mtime_ns:x}",
+                "lastModified": stat.st_mtime,
+                "immutable": bool(hashedNamePattern.search(name)),
+                "variants": variants,
+            }
+    return manifest
+
+
+def pickEncoding(asset):
+    for encoding, _ in encodingSuffixes:
+        if encoding in asset["variants"] and request.accept_encodings[encoding]:
+            return encoding
+    return None
+
+
+def sendAsset(asset):
+    encoding = pickEncoding(asset)
+    response = send_file(
+        asset["variants"][encoding] if encoding else asset["path"],
+        mimetype=asset["mimetype"],
+        # each encoding is its own representation, so it needs its own validator
+        etag=asset["etag"] + ("-" + encoding if encoding else ""),
+        last_modified=asset["lastModified"],
+        # index.html and friends have no max-age, so they are always revalidated
+        max_age=immutableMaxAge if asset["immutable"] else None,
+        conditional=True,
+    )
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    if asset["variants"]:
+        response.vary.add("Accept-Encoding")
+    if asset["immutable"]:
+        response.cache_control.immutable = True
+    return response
+
+
+def sendAssetOrIndex(manifest, path):
+    # client-side routes of the SPA fall back to index.html
+    asset = manifest.get(path) or manifest.get("index.html")
+    if asset is None:
+        return jsonify({"message": "Not found."}), 404
+    return sendAsset(asset)
@@ -1,13 +1,59 @@
+import json
+import os
 from datetime import datetime,timezone,timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+displayFormat = "%Y/%m/%d %H:%M:%S"
+
+def loadTimezone(name):
+    # IANA names ("Asia/Taipei") or fixed offsets ("+08:00") for hosts without tzdata
+    if name[:1] in "+-":
+        hours, minutes = name[1:].split(":")
+        offset = timedelta(hours=int(hours), minutes=int(minutes))
+        return timezone(offset if name[0] == "+" else -offset)
+    try:
+        return ZoneInfo(name)
+    except ZoneInfoNotFoundError:
+        print("Unknown timezone " + name + ", using +08:00")
+        return timezone(timedelta(hours=8))
+
+# built once at import, every call below reuses these objects
+localTimezone = loadTimezone(os.getenv("APP_TIMEZONE", "Asia/Taipei"))
+# {"companyName": "Asia/Tokyo"} for companies outside the default zone
+companyTimezones = {
+    companyName: loadTimezone(name)
+    for companyName, name in json.loads(os.getenv("COMPANY_TIMEZONES", "{}")).items()
+}
+
+def getTimezone(companyName=None):
+    return companyTimezones.get(companyName, localTimezone)
+
+def getTimezoneName(tz):
+    # what Mongo's date operators accept: an IANA name or a "+08:00" offset
+    if isinstance(tz, ZoneInfo):
+        return tz.key
+    offset = datetime.now(tz).strftime("%z")
+    return offset[:3] + ":" + offset[3:]
+
+def getNow(companyName=None):
+    # aware datetime for storage, Mongo keeps it as a BSON date
+    return datetime.now(getTimezone(companyName))
+
+def toLocal(dt, companyName=None):
+    # pymongo returns naive UTC datetimes
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(getTimezone(companyName))
+
+def formatTime(dt, companyName=None):
+    # strings are only made here, at the reply/presentation edge
+    return toLocal(dt, companyName).strftime(displayFormat)
+
+def getMonthKey(dt, companyName=None):
+    return toLocal(dt, companyName).strftime("%Y-%m")
 
 def getCurrentTime():
-    dt1 = datetime.utcnow().replace(tzinfo=timezone.utc)
-    dt2 = dt1.astimezone(timezone(timedelta(hours=8)))
-    currentTime = dt2.strftime("%Y/%m/%d %H:%M:%S")
-    return currentTime
+    return formatTime(getNow())
 
 def getCurrentMonth():
-    dt1 = datetime.utcnow().replace(tzinfo=timezone.utc)
-    dt2 = dt1.astimezone(timezone(timedelta(hours=8)))
-    currentMonth = dt2.strftime("/%m")
-    return currentMonth
\ No newline at end of file
+    return getNow().strftime("/%m")